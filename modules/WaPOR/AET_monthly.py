@@ -18,13 +18,14 @@ from .WaPOR_v3 import AET_monthly as _AET_monthly
 
 
 def main(Dir,
-         Startdate='2009-01-01',
+         Startdate='2018-01-01',
          Enddate='2018-12-31',
          latlim=[-40.05, 40.05],
          lonlim=[-30.5, 65.05],
          level=1,
          version=3,
-         Waitbar=1):
+         Waitbar=1,
+         n_threads=8):
     """
     Download WaPOR v3 monthly actual evapotranspiration + interception (AETI).
 
@@ -33,7 +34,8 @@ def main(Dir,
     Dir : str
         Output directory.
     Startdate : str, optional
-        Start date in 'YYYY-MM-DD' format. Default '2009-01-01'.
+        Start date in 'YYYY-MM-DD' format. Default '2018-01-01', the start
+        of WaPOR v3; earlier dates are moved up to it.
     Enddate : str, optional
         End date in 'YYYY-MM-DD' format. Default '2018-12-31'.
     latlim : list(float, float), optional
@@ -48,6 +50,8 @@ def main(Dir,
         warning.
     Waitbar : int, optional
         1 to print progress to screen, 0 for silent.
+    n_threads : int, optional
+        Number of rasters downloaded concurrently. Default 8.
 
     Returns
     -------
@@ -55,6 +59,7 @@ def main(Dir,
         Files are written to disk in a subfolder:
         <Dir>/<mapset_code>/Lx-AETI-M.YYYY-MM.tif
     """
+    # _AET_monthly moves a Startdate before WaPOR v3 up to its start
     return _AET_monthly(
         Dir=Dir,
         Startdate=Startdate,
@@ -64,6 +69,7 @@ def main(Dir,
         level=level,
         version=version,
         Waitbar=Waitbar,
+        n_threads=n_threads,
     )
 
 
@@ -48,7 +48,7 @@ def GetGeoInfo(fh, subdataset = 0):
     driver = gdal.GetDriverByName(Type)
     return driver, NDV, xsize, ysize, GeoT, Projection
 
-def OpenAsArray(fh, bandnumber = 1, dtype = 'float32', nan_values = False):
+def OpenAsArray(fh, bandnumber = 1, dtype = 'float32', nan_values = False, out = None):
     """
     Open a map as an numpy array. 
     
@@ -63,6 +63,9 @@ def OpenAsArray(fh, bandnumber = 1, dtype = 'float32', nan_values = False):
     nan_values : boolean, optional
         Convert he no-data-values into np.nan values, note that dtype needs to
         be a float if True. Default is False.
+    out : ndarray, optional
+        Array to read into instead of allocating a new one. Only used if its
+        shape and dtype match the band, default is None.
         
     Returns
     -------
@@ -72,6 +75,9 @@ def OpenAsArray(fh, bandnumber = 1, dtype = 'float32', nan_values = False):
     datatypes = {"uint8": np.uint8, "int8": np.int8, "uint16": np.uint16, "int16":  np.int16, "Int16":  np.int16, "uint32": np.uint32,
     "int32": np.int32, "float32": np.float32, "float64": np.float64, "complex64": np.complex64, "complex128": np.complex128,
     "Int32": np.int32, "Float32": np.float32, "Float64": np.float64, "Complex64": np.complex64, "Complex128": np.complex128,}
+    gdal_datatypes = {"uint8": gdal.GDT_Byte, "uint16": gdal.GDT_UInt16, "int16": gdal.GDT_Int16, "Int16": gdal.GDT_Int16,
+    "uint32": gdal.GDT_UInt32, "int32": gdal.GDT_Int32, "Int32": gdal.GDT_Int32, "float32": gdal.GDT_Float32,
+    "Float32": gdal.GDT_Float32, "float64": gdal.GDT_Float64, "Float64": gdal.GDT_Float64,}
     DataSet = gdal.Open(fh, gdal.GA_ReadOnly)
     Type = DataSet.GetDriver().ShortName
     if Type == 'HDF4':
@@ -80,12 +86,20 @@ def OpenAsArray(fh, bandnumber = 1, dtype = 'float32', nan_values = False):
     else:
         Subdataset = DataSet.GetRasterBand(bandnumber)
         NDV = Subdataset.GetNoDataValue()
-    Array = Subdataset.ReadAsArray().astype(datatypes[dtype])
+    if (out is not None and Type != 'HDF4' and dtype in gdal_datatypes and
+            out.shape == (Subdataset.YSize, Subdataset.XSize) and
+            out.dtype == datatypes[dtype]):
+        Array = Subdataset.ReadAsArray(buf_obj = out)
+    elif dtype in gdal_datatypes:
+        # Let GDAL convert while reading, avoids a second full-size copy
+        Array = Subdataset.ReadAsArray(buf_type = gdal_datatypes[dtype])
+    else:
+        Array = Subdataset.ReadAsArray().astype(datatypes[dtype], copy = False)
     if nan_values:
         Array[Array == NDV] = np.nan
     return Array
 
-def CreateGeoTiff(fh, Array, driver, NDV, xsize, ysize, GeoT, Projection, explicit = True, compress = None):
+def CreateGeoTiff(fh, Array, driver, NDV, xsize, ysize, GeoT, Projection, explicit = True, compress = None, options = None):
     """
     Creates a geotiff from a numpy array.
     
@@ -107,14 +121,19 @@ def CreateGeoTiff(fh, Array, driver, NDV, xsize, ysize, GeoT, Projection, explic
         List with geotransform values.
     Projection : str
         Projection of fh.    
+    compress : str, optional
+        Compression method, e.g. 'LZW'. Default is None.
+    options : list, optional
+        Additional creation options, e.g. ['TILED=YES', 'ZLEVEL=1'].
+        Default is None.
     """
     datatypes = {"uint8": 1, "int8": 1, "uint16": 2, "int16": 3, "Int16": 3, "uint32": 4,
     "int32": 5, "float32": 6, "float64": 7, "complex64": 10, "complex128": 11,
     "Int32": 5, "Float32": 6, "Float64": 7, "Complex64": 10, "Complex128": 11,}
+    creation_options = list(options) if options != None else []
     if compress != None:
-        DataSet = driver.Create(fh,xsize,ysize,1,datatypes[Array.dtype.name], ['COMPRESS={0}'.format(compress)])
-    else:
-        DataSet = driver.Create(fh,xsize,ysize,1,datatypes[Array.dtype.name])
+        creation_options.append('COMPRESS={0}'.format(compress))
+    DataSet = driver.Create(fh,xsize,ysize,1,datatypes[Array.dtype.name], creation_options)
     if NDV is None:
         NDV = -9999
     if explicit:
@@ -6,36 +6,23 @@ This is a v3 replacement of the original v2-based LCC_yearly module.
 Note: LCC is categorical data, no scale factor is applied.
 """
 
-from datetime import datetime, date
+from datetime import datetime
 import os
-import numpy as np
+import uuid
 from osgeo import gdal
 
 import WaPOR
 from WaPOR import GIS_functions as gis
+from WaPOR._waporv3_pipeline import select_by_date
 from WaPOR.waporv3_api import base_url, collect_responses
 
 
 SCALE_FACTOR = 1.0  # No scaling for categorical land cover data
 
-
-def _parse_date_from_code(code):
-    """Extract a date from a WaPOR v3 raster code."""
-    token = code.split('.')[-1]
-    token = token.split('_')[-1]
-
-    for fmt in ("%Y-%m-%d", "%Y-%m", "%Y"):
-        try:
-            dt = datetime.strptime(token, fmt)
-            if fmt == "%Y":
-                return date(dt.year, 1, 1)
-            elif fmt == "%Y-%m":
-                return date(dt.year, dt.month, 1)
-            else:
-                return dt.date()
-        except ValueError:
-            continue
-    return None
+# Integer classes: horizontal differencing predictor instead of the
+# floating point one used for the continuous variables
+LCC_GTIFF_OPTIONS = ['TILED=YES', 'BLOCKXSIZE=512', 'BLOCKYSIZE=512',
+                     'COMPRESS=DEFLATE', 'PREDICTOR=2', 'ZLEVEL=1']
 
 
 def main(Dir,
@@ -91,13 +78,7 @@ def main(Dir,
         return None
 
     # Filter rasters by date
-    selected = []
-    for code, url in all_rasters:
-        dt = _parse_date_from_code(code)
-        if dt is None:
-            continue
-        if (dt >= start_dt) and (dt <= end_dt):
-            selected.append((dt, code, url))
+    selected = select_by_date(all_rasters, start_dt, end_dt, is_sorted=True)
 
     if len(selected) == 0:
         print("No rasters found within requested date range.")
@@ -110,6 +91,9 @@ def main(Dir,
     if not os.path.exists(out_dir):
         os.makedirs(out_dir)
 
+    # Files already on disk, listed once instead of a stat per raster
+    existing = {e.name for e in os.scandir(out_dir)}
+
     # Progress bar
     if Waitbar == 1:
         try:
@@ -129,13 +113,14 @@ def main(Dir,
     # Loop over rasters
     bbox = [lonlim[0], latlim[0], lonlim[1], latlim[1]]
 
+    failed = []
     for dt, code, url in selected:
         fname = 'LCC_WAPOR.v3_level{}_annually_{:04d}.tif'.format(
             level, dt.year
         )
         out_path = os.path.join(out_dir, fname)
 
-        if os.path.exists(out_path):
+        if fname in existing:
             print("File exists, skipping:", fname)
             if Waitbar == 1 and 'amount' in locals():
                 amount += 1
@@ -150,25 +135,35 @@ def main(Dir,
 
         print("Downloading + cropping:", code)
 
-        tmp_path = os.path.join(out_dir, "_tmp_{}.tif".format(code.replace('.', '_')))
+        # Keep the cropped intermediate in memory instead of on disk
+        tmp_path = f"/vsimem/_tmp_{uuid.uuid4().hex}.tif"
 
         warp_opts = gdal.WarpOptions(
             outputBounds=bbox,
             dstNodata=-9999,
-            resampleAlg='near'  # Use nearest neighbor for categorical data
+            resampleAlg='near',  # Use nearest neighbor for categorical data
+            multithread=True,
+            warpMemoryLimit=512 * 1024 * 1024
         )
-        gdal.Warp(tmp_path, f"/vsicurl/{url}", options=warp_opts)
 
-        # Read and save (no scaling for categorical data)
-        driver, NDV, xsize, ysize, GeoT, Projection = gis.GetGeoInfo(tmp_path)
-        arr = gis.OpenAsArray(tmp_path, nan_values=False)
+        try:
+            ds = gdal.Warp(tmp_path, f"/vsicurl/{url}", options=warp_opts)
+            if ds is None:
+                print("ERROR: GDAL Warp failed for", code)
+                failed.append(code)
+            else:
+                ds = None  # Flush to /vsimem/
 
-        # For LCC, preserve integer values - no scaling needed
-        gis.CreateGeoTiff(out_path, arr.astype("int16"),
-                          driver, NDV, xsize, ysize, GeoT, Projection)
+                # Read and save (no scaling for categorical data)
+                driver, NDV, xsize, ysize, GeoT, Projection = gis.GetGeoInfo(tmp_path)
+                arr = gis.OpenAsArray(tmp_path, dtype='int16', nan_values=False)
 
-        if os.path.exists(tmp_path):
-            os.remove(tmp_path)
+                # For LCC, preserve integer values - no scaling needed
+                gis.CreateGeoTiff(out_path, arr,
+                                  driver, NDV, xsize, ysize, GeoT, Projection,
+                                  options=LCC_GTIFF_OPTIONS)
+        finally:
+            gdal.Unlink(tmp_path)
 
         if Waitbar == 1 and 'amount' in locals():
             amount += 1
@@ -180,5 +175,8 @@ def main(Dir,
                     length=50
                 )
 
+    if failed:
+        print(f"WARNING: {len(failed)} of {len(selected)} rasters could "
+              f"not be cropped: {', '.join(failed)}")
     print(f"\nFinished downloading WaPOR v3 yearly Land Cover Classification ({mapset_code})")
     return out_dir
\ No newline at end of file
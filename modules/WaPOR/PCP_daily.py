@@ -5,13 +5,15 @@ Daily precipitation from WaPOR v3 (L1-PCP-E)
 This is a v3 replacement of the original v2-based PCP_daily module.
 """
 
-from datetime import datetime, date
+from datetime import datetime
 import os
-import numpy as np
+import uuid
 from osgeo import gdal
 
 import WaPOR
 from WaPOR import GIS_functions as gis
+from WaPOR._waporv3_common import _clip_and_scale
+from WaPOR._waporv3_pipeline import GTIFF_OPTIONS, select_by_date
 from WaPOR.waporv3_api import base_url, collect_responses
 
 
@@ -19,25 +21,6 @@ MAPSET_CODE = "L1-PCP-E"
 SCALE_FACTOR = 0.1  # multiply raw values to get mm
 
 
-def _parse_date_from_code(code):
-    """Extract a date from a WaPOR v3 raster code."""
-    token = code.split('.')[-1]
-    token = token.split('_')[-1]
-
-    for fmt in ("%Y-%m-%d", "%Y-%m", "%Y"):
-        try:
-            dt = datetime.strptime(token, fmt)
-            if fmt == "%Y":
-                return date(dt.year, 1, 1)
-            elif fmt == "%Y-%m":
-                return date(dt.year, dt.month, 1)
-            else:
-                return dt.date()
-        except ValueError:
-            continue
-    return None
-
-
 def main(Dir,
          Startdate='2018-01-01',
          Enddate='2024-12-31',
@@ -80,13 +63,7 @@ def main(Dir,
         return None
 
     # Filter rasters by date
-    selected = []
-    for code, url in all_rasters:
-        dt = _parse_date_from_code(code)
-        if dt is None:
-            continue
-        if (dt >= start_dt) and (dt <= end_dt):
-            selected.append((dt, code, url))
+    selected = select_by_date(all_rasters, start_dt, end_dt, is_sorted=True)
 
     if len(selected) == 0:
         print("No rasters found within requested date range.")
@@ -99,6 +76,9 @@ def main(Dir,
     if not os.path.exists(out_dir):
         os.makedirs(out_dir)
 
+    # Files already on disk, listed once instead of a stat per raster
+    existing = {e.name for e in os.scandir(out_dir)}
+
     # Progress bar
     if Waitbar == 1:
         try:
@@ -118,13 +98,14 @@ def main(Dir,
     # Loop over rasters and download + crop + scale
     bbox = [lonlim[0], latlim[0], lonlim[1], latlim[1]]
 
+    failed = []
     for dt, code, url in selected:
         fname = 'P_WAPOR.v3_mm-day-1_daily_{:04d}.{:02d}.{:02d}.tif'.format(
             dt.year, dt.month, dt.day
         )
         out_path = os.path.join(out_dir, fname)
 
-        if os.path.exists(out_path):
+        if fname in existing:
             print("File exists, skipping:", fname)
             if Waitbar == 1 and 'amount' in locals():
                 amount += 1
@@ -139,27 +120,36 @@ def main(Dir,
 
         print("Downloading + cropping:", code)
 
-        tmp_path = os.path.join(out_dir, "_tmp_{}.tif".format(code.replace('.', '_')))
+        # Keep the cropped intermediate in memory instead of on disk
+        tmp_path = f"/vsimem/_tmp_{uuid.uuid4().hex}.tif"
 
         warp_opts = gdal.WarpOptions(
             outputBounds=bbox,
-            dstNodata=-9999
+            dstNodata=-9999,
+            resampleAlg='near',
+            multithread=True,
+            warpMemoryLimit=512 * 1024 * 1024
         )
-        gdal.Warp(tmp_path, f"/vsicurl/{url}", options=warp_opts)
 
-        # Read, scale, save
-        driver, NDV, xsize, ysize, GeoT, Projection = gis.GetGeoInfo(tmp_path)
-        arr = gis.OpenAsArray(tmp_path, nan_values=True)
+        try:
+            ds = gdal.Warp(tmp_path, f"/vsicurl/{url}", options=warp_opts)
+            if ds is None:
+                print("ERROR: GDAL Warp failed for", code)
+                failed.append(code)
+            else:
+                ds = None  # Flush to /vsimem/
 
-        arr = np.where(np.isnan(arr), NDV, arr)
-        arr = np.where(arr < 0, 0, arr)
-        arr = arr * SCALE_FACTOR
+                # Read, scale, save
+                driver, NDV, xsize, ysize, GeoT, Projection = gis.GetGeoInfo(tmp_path)
+                arr = gis.OpenAsArray(tmp_path, dtype='float32', nan_values=True)
 
-        gis.CreateGeoTiff(out_path, arr.astype("float32"),
-                          driver, NDV, xsize, ysize, GeoT, Projection)
+                _clip_and_scale(arr, NDV, SCALE_FACTOR)
 
-        if os.path.exists(tmp_path):
-            os.remove(tmp_path)
+                gis.CreateGeoTiff(out_path, arr,
+                                  driver, NDV, xsize, ysize, GeoT, Projection,
+                                  options=GTIFF_OPTIONS)
+        finally:
+            gdal.Unlink(tmp_path)
 
         if Waitbar == 1 and 'amount' in locals():
             amount += 1
@@ -171,5 +161,8 @@ def main(Dir,
                     length=50
                 )
 
+    if failed:
+        print(f"WARNING: {len(failed)} of {len(selected)} rasters could "
+              f"not be cropped: {', '.join(failed)}")
     print("\nFinished downloading WaPOR v3 daily precipitation")
     return out_dir
\ No newline at end of file
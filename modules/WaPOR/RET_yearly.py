@@ -5,37 +5,71 @@ Yearly Reference Evapotranspiration from WaPOR v3 (L1-RET-A)
 This is a v3 replacement of the original v2-based RET_yearly module.
 """
 
-from datetime import datetime, date
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+import logging
 import os
-import numpy as np
+import uuid
 from osgeo import gdal
 
 import WaPOR
 from WaPOR import GIS_functions as gis
-from WaPOR.waporv3_api import base_url, collect_responses
+from WaPOR.waporv3_api import base_url, collect_responses_cached
+from WaPOR._waporv3_common import _clip_and_scale
+from WaPOR._waporv3_pipeline import (GTIFF_OPTIONS, _download_file,
+                                     _init_worker, select_by_date,
+                                     throttled_waitbar, with_retry)
+
+
+logger = logging.getLogger(__name__)
 
 
 MAPSET_CODE = "L1-RET-A"
 SCALE_FACTOR = 0.1  # multiply raw values to get mm
 
 
-def _parse_date_from_code(code):
-    """Extract a date from a WaPOR v3 raster code."""
-    token = code.split('.')[-1]
-    token = token.split('_')[-1]
-
-    for fmt in ("%Y-%m-%d", "%Y-%m", "%Y"):
-        try:
-            dt = datetime.strptime(token, fmt)
-            if fmt == "%Y":
-                return date(dt.year, 1, 1)
-            elif fmt == "%Y-%m":
-                return date(dt.year, dt.month, 1)
-            else:
-                return dt.date()
-        except ValueError:
-            continue
-    return None
+def _process_one(code, url, out_path, bbox):
+    """Crop one raster from its remote COG, scale it and save to out_path."""
+    logger.debug("Downloading + cropping %s (URL=%s)", code, url)
+
+    # Keep the cropped intermediate in memory instead of on disk
+    tmp_path = f"/vsimem/_tmp_{uuid.uuid4().hex}.tif"
+    tmp_raw = os.path.join(os.path.dirname(out_path),
+                           f"_raw_{code.replace('.', '_')}.tif")
+
+    try:
+        warp_opts = gdal.WarpOptions(
+            outputBounds=bbox,
+            dstNodata=-9999,
+            outputType=gdal.GDT_Float32,  # GDAL converts while warping
+            resampleAlg='near',
+            multithread=True,
+            warpMemoryLimit=512 * 1024 * 1024
+        )
+        ds = gdal.Warp(tmp_path, f"/vsicurl/{url}", options=warp_opts)
+        if ds is None:
+            # Streaming failed, fetch the whole file over the pooled
+            # keep-alive session and crop the local copy
+            logger.debug("Streaming failed for %s, downloading raw file", code)
+            if _download_file(url, tmp_raw):
+                ds = gdal.Warp(tmp_path, tmp_raw, options=warp_opts)
+        if ds is None:
+            raise RuntimeError(f"gdal.Warp failed for {code}")
+        ds = None  # Flush to /vsimem/
+
+        # Read, scale, save
+        driver, NDV, xsize, ysize, GeoT, Projection = gis.GetGeoInfo(tmp_path)
+        arr = gis.OpenAsArray(tmp_path, dtype='float32', nan_values=True)
+
+        _clip_and_scale(arr, NDV, SCALE_FACTOR)
+
+        gis.CreateGeoTiff(out_path, arr,
+                          driver, NDV, xsize, ysize, GeoT, Projection,
+                          options=GTIFF_OPTIONS)
+    finally:
+        gdal.Unlink(tmp_path)
+        if os.path.exists(tmp_raw):
+            os.remove(tmp_raw)
 
 
 def main(Dir,
@@ -44,7 +78,9 @@ def main(Dir,
          latlim=[-40.05, 40.05],
          lonlim=[-30.5, 65.05],
          version=3,
-         Waitbar=1):
+         Waitbar=1,
+         max_workers=8,
+         no_cache=False):
     """
     Download yearly WaPOR v3 Reference ET (L1-RET-A) for given period and bbox.
 
@@ -60,6 +96,10 @@ def main(Dir,
         Kept for backward compatibility (ignored, always uses v3).
     Waitbar : int (0 or 1)
         If 1, prints a simple textual progress bar.
+    max_workers : int
+        Number of rasters downloaded concurrently, default is 8.
+    no_cache : bool
+        If True, bypass the one-day cache of the raster listing.
     """
 
     print(f"\nDownload yearly WaPOR v3 Reference Evapotranspiration data "
@@ -72,102 +112,70 @@ def main(Dir,
     mapset_url = f"{base_url}/{MAPSET_CODE}/rasters"
 
     try:
-        all_rasters = collect_responses(mapset_url,
-                                        info=["code", "downloadUrl"])
+        all_rasters = collect_responses_cached(mapset_url, MAPSET_CODE,
+                                               info=["code", "downloadUrl"],
+                                               no_cache=no_cache)
     except Exception as e:
         print("ERROR: cannot get list of available data from WaPOR v3")
         print(e)
         return None
 
-    # Filter rasters by date
-    selected = []
-    for code, url in all_rasters:
-        dt = _parse_date_from_code(code)
-        if dt is None:
-            continue
-        if (dt >= start_dt) and (dt <= end_dt):
-            selected.append((dt, code, url))
+    # Filter rasters by date, the listing is sorted so the window is bisected
+    selected = select_by_date(all_rasters, start_dt, end_dt, is_sorted=True)
 
     if len(selected) == 0:
         print("No rasters found within requested date range.")
         return None
 
-    selected.sort(key=lambda x: x[0])
-
     # Prepare output directory
     out_dir = os.path.join(Dir, MAPSET_CODE)
     if not os.path.exists(out_dir):
         os.makedirs(out_dir)
 
-    # Progress bar
-    if Waitbar == 1:
-        try:
-            import WaPOR.WaitbarConsole as WaitbarConsole
-        except ImportError:
-            WaitbarConsole = None
-        total_amount = len(selected)
-        amount = 0
-        if WaitbarConsole is not None:
-            WaitbarConsole.printWaitBar(
-                amount, total_amount,
-                prefix='Progress:',
-                suffix='Complete',
-                length=50
-            )
-
-    # Loop over rasters
+    # Files already on disk, listed once instead of a stat per raster
+    existing = {e.name for e in os.scandir(out_dir)}
+
+    # Bounding box for crop
     bbox = [lonlim[0], latlim[0], lonlim[1], latlim[1]]
 
+    todo = []
     for dt, code, url in selected:
         fname = 'RET_WAPOR.v3_mm-year-1_annually_{:04d}.tif'.format(dt.year)
-        out_path = os.path.join(out_dir, fname)
-
-        if os.path.exists(out_path):
-            print("File exists, skipping:", fname)
-            if Waitbar == 1 and 'amount' in locals():
-                amount += 1
-                if WaitbarConsole is not None:
-                    WaitbarConsole.printWaitBar(
-                        amount, total_amount,
-                        prefix='Progress:',
-                        suffix='Complete',
-                        length=50
-                    )
-            continue
-
-        print("Downloading + cropping:", code)
 
-        tmp_path = os.path.join(out_dir, "_tmp_{}.tif".format(code.replace('.', '_')))
-
-        warp_opts = gdal.WarpOptions(
-            outputBounds=bbox,
-            dstNodata=-9999
-        )
-        gdal.Warp(tmp_path, f"/vsicurl/{url}", options=warp_opts)
-
-        # Read, scale, save
-        driver, NDV, xsize, ysize, GeoT, Projection = gis.GetGeoInfo(tmp_path)
-        arr = gis.OpenAsArray(tmp_path, nan_values=True)
-
-        arr = np.where(np.isnan(arr), NDV, arr)
-        arr = np.where(arr < 0, 0, arr)
-        arr = arr * SCALE_FACTOR
-
-        gis.CreateGeoTiff(out_path, arr.astype("float32"),
-                          driver, NDV, xsize, ysize, GeoT, Projection)
-
-        if os.path.exists(tmp_path):
-            os.remove(tmp_path)
+        if fname in existing:
+            logger.debug("File exists, skipping %s", fname)
+            continue
 
-        if Waitbar == 1 and 'amount' in locals():
+        todo.append((code, url, os.path.join(out_dir, fname)))
+
+    # Progress bar, redrawn at most every 0.1 s
+    total_amount = len(selected)
+    amount = total_amount - len(todo)
+    show_waitbar = throttled_waitbar(total_amount) if Waitbar == 1 else None
+    if show_waitbar is not None:
+        show_waitbar(amount)
+
+    # Crop the rasters concurrently, each worker waits on its own
+    # /vsicurl/ range requests
+    # A single worker keeps GDAL's ALL_CPUS threading, see _init_worker
+    initializer = _init_worker if max_workers > 1 else None
+    with ThreadPoolExecutor(max_workers=max_workers,
+                            initializer=initializer) as executor:
+        process_one = with_retry(_process_one)
+        futures = {executor.submit(process_one, code, url, out_path, bbox):
+                   (code, out_path)
+                   for code, url, out_path in todo}
+        for future in as_completed(futures):
+            try:
+                future.result()
+            except Exception as e:
+                code, out_path = futures[future]
+                print(f"  !! ERROR: {code} failed: {e}")
+                if os.path.exists(out_path):
+                    os.remove(out_path)
             amount += 1
-            if WaitbarConsole is not None:
-                WaitbarConsole.printWaitBar(
-                    amount, total_amount,
-                    prefix='Progress:',
-                    suffix='Complete',
-                    length=50
-                )
+            if show_waitbar is not None:
+                show_waitbar(amount)
 
     print("\nFinished downloading WaPOR v3 yearly Reference ET")
     return out_dir
\ No newline at end of file
@@ -5,8 +5,12 @@ Mimics the WaPOR v2 interface but uses WaPOR v3 API (no authentication needed)
 Compatible with existing WAPORWA workflows
 """
 
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import logging
 import os
 import re
+import threading
+import uuid
 from osgeo import gdal
 import numpy as np
 from datetime import datetime
@@ -18,6 +22,15 @@ except ImportError:
     print("ERROR: Cannot import waporv3_api. Make sure waporv3_api.py is in the same directory.")
     raise
 
+try:
+    from WaPOR._waporv3_common import (FIRST_DATE, _clip_and_scale,
+                                       _init_worker, clamp_startdate,
+                                       configure_gdal, throttled_waitbar)
+except ImportError:
+    from _waporv3_common import (FIRST_DATE, _clip_and_scale, _init_worker,
+                                 clamp_startdate, configure_gdal,
+                                 throttled_waitbar)
+
 # Import GIS functions (from your existing code)
 try:
     import GIS_functions as gis
@@ -26,6 +39,12 @@ except ImportError:
     gis = None
 
 
+# The downloads are GDAL's own /vsicurl/ range requests, see configure_gdal
+configure_gdal()
+
+logger = logging.getLogger(__name__)
+
+
 # Scale factors for WaPOR v3 datasets
 # Most precipitation and ET products use 0.1 scale factor
 SCALE_FACTORS = {
@@ -77,8 +96,133 @@ SCALE_FACTORS = {
 }
 
 
+# Each download worker reads every raster of a mapset into one float32
+# buffer; all rasters share the bbox and so the shape
+_buffers = threading.local()
+
+
+def _buffer_for(ysize, xsize):
+    """This thread's float32 read buffer, reallocated if the shape changes."""
+    buf = getattr(_buffers, 'arr', None)
+    if buf is None or buf.shape != (ysize, xsize):
+        buf = np.empty((ysize, xsize), np.float32)
+        _buffers.arr = buf
+    return buf
+
+
+def _fname_for(mapset_code, code):
+    """Output file name of a raster: <mapset_code>.<date part of code>.tif"""
+    date_part = code.split('.')[-1] if '.' in code else code
+    return f"{mapset_code}.{date_part}.tif"
+
+
+def _creation_options(url):
+    """
+    GeoTIFF creation options matching the block layout of the remote COG,
+    so the output tiles line up with the source tiles.
+    
+    Falls back to 512x512 tiles if the source cannot be opened or is not
+    tiled (TIFF tiles must be a multiple of 16).
+    """
+    bx, by = 512, 512
+    ds = gdal.Open(f"/vsicurl/{url}")
+    if ds is not None:
+        src_bx, src_by = ds.GetRasterBand(1).GetBlockSize()
+        if src_bx % 16 == 0 and src_by % 16 == 0:
+            bx, by = src_bx, src_by
+        ds = None
+    return ['COMPRESS=LZW', 'PREDICTOR=3', 'TILED=YES',
+            f'BLOCKXSIZE={bx}', f'BLOCKYSIZE={by}']
+
+
+def _postprocess_identity(Array, NDV):
+    """Post-processing of unscaled mapsets: clip and set no-data only."""
+    _clip_and_scale(Array, NDV, None)
+
+
+def _make_postprocess(scale):
+    """
+    Return the in-place post-processing for a mapset's scale factor.
+
+    The choice is made once per mapset, and the factor is cast to float32
+    so multiplying the float32 rasters never upcasts.
+    """
+    if scale in (1, 1.0, None):
+        return _postprocess_identity
+    scale = np.float32(scale)
+
+    def _postprocess_scaled(Array, NDV):
+        _clip_and_scale(Array, NDV, scale)
+
+    return _postprocess_scaled
+
+
+def _process_one(code, url, out_path, bbox, postprocess, creation_options):
+    """
+    Crop a single raster from its remote COG, scale it with postprocess
+    (see _make_postprocess) and write it to out_path with
+    creation_options (see _creation_options).
+
+    The crop is kept in /vsimem/ so out_path is encoded only once. Without
+    GIS_functions the crop is written to out_path as is.
+
+    Returns
+    -------
+    bool
+        True if out_path was written, False otherwise.
+    """
+    fname = os.path.basename(out_path)
+    tmp_path = out_path if gis is None else f"/vsimem/_tmp_{uuid.uuid4().hex}.tif"
+    try:
+        # Download and clip using GDAL
+        # Use /vsicurl/ to read directly from URL
+        warp_options = gdal.WarpOptions(
+            outputBounds=bbox,  # xmin, ymin, xmax, ymax
+            dstNodata=-9999,
+            outputType=gdal.GDT_Float32,  # GDAL converts while warping
+            resampleAlg='near',
+            multithread=True,
+            warpMemoryLimit=512 * 1024 * 1024,
+            creationOptions=creation_options if gis is None else []
+        )
+        
+        ds = gdal.Warp(tmp_path, f"/vsicurl/{url}", options=warp_options)
+        
+        if ds is None:
+            print(f"ERROR: Failed to download {fname}")
+            return False
+        
+        ds = None  # Close dataset
+        
+        # Apply scaling and clean data if GIS_functions available
+        if gis is not None:
+            driver, NDV, xsize, ysize, GeoT, Projection = gis.GetGeoInfo(tmp_path)
+            Array = gis.OpenAsArray(tmp_path, dtype='float32', nan_values=True,
+                                    out=_buffer_for(ysize, xsize))
+            
+            # Apply WaPOR conventions, in place on the float32 array:
+            # - Negative values -> 0 (except NoData)
+            # - Apply scale factor
+            postprocess(Array, NDV)
+            
+            gis.CreateGeoTiff(out_path, Array,
+                            driver, NDV, xsize, ysize, GeoT, Projection,
+                            options=creation_options)
+        
+    except Exception as e:
+        print(f"ERROR downloading {fname}: {e}")
+        if os.path.exists(out_path):
+            os.remove(out_path)
+        return False
+    finally:
+        if gis is not None:
+            gdal.Unlink(tmp_path)
+
+    return True
+
+
 def _download_mapset(mapset_code, Dir, latlim, lonlim, 
-                     Startdate='', Enddate='', Waitbar=1):
+                     Startdate='', Enddate='', Waitbar=1, n_threads=8):
     """
     Generic WaPOR v3 downloader.
     
@@ -98,6 +242,8 @@ def _download_mapset(mapset_code, Dir, latlim, lonlim,
         End date 'YYYY-MM-DD'
     Waitbar : int
         Show progress (1) or not (0)
+    n_threads : int
+        Number of rasters downloaded concurrently, default is 8
     """
     
     if Waitbar:
@@ -114,7 +260,8 @@ def _download_mapset(mapset_code, Dir, latlim, lonlim,
     
     # Get all rasters for this mapset
     try:
-        all_rasters = get_rasters(mapset_code, include_url=True)
+        # Only filtered and downloaded in completion order, no need to sort
+        all_rasters = get_rasters(mapset_code, include_url=True, sort=False)
     except Exception as e:
         print(f"ERROR: Could not get rasters for {mapset_code}: {e}")
         return
@@ -123,80 +270,62 @@ def _download_mapset(mapset_code, Dir, latlim, lonlim,
         print(f"WARNING: No rasters found for {mapset_code}")
         return
     
+    # Drop the rasters already on disk first, so restarts only cost one
+    # directory listing and the date filter only sees what is left
+    existing = set(os.listdir(out_dir))
+    wanted = [(code, url) for code, url in all_rasters
+              if _fname_for(mapset_code, code) not in existing]
+    
     # Filter by date if specified
     if Startdate and Enddate:
-        all_rasters = filter_rasters_by_date(all_rasters, Startdate, Enddate)
-        if not all_rasters:
-            print(f"WARNING: No rasters found in date range {Startdate} to {Enddate}")
-            return
+        wanted = filter_rasters_by_date(wanted, Startdate, Enddate)
     
-    n_total = len(all_rasters)
+    if not wanted:
+        if Waitbar:
+            print(f"Nothing to download for {mapset_code} in date range "
+                  f"{Startdate} to {Enddate}")
+        return
+    
+    n_total = len(wanted)
     scale = SCALE_FACTORS.get(mapset_code, 1.0)
     
     if Waitbar:
-        print(f"Found {n_total} rasters to download")
+        print(f"Found {n_total} rasters to download "
+              f"({len(all_rasters) - len(wanted)} skipped or out of range)")
         if scale != 1.0:
             print(f"Using scale factor: {scale}")
     
-    # Download and process each raster
-    for i, (code, url) in enumerate(all_rasters, start=1):
-        # Create filename from raster code
-        # Remove mapset prefix to get date part
-        date_part = code.split('.')[-1] if '.' in code else code
-        fname = f"{mapset_code}.{date_part}.tif"
-        out_path = os.path.join(out_dir, fname)
-        
-        # Skip if already exists
-        if os.path.exists(out_path):
-            if Waitbar:
-                print(f"[{i}/{n_total}] Skipping existing: {fname}")
-            continue
-        
-        if Waitbar:
-            print(f"[{i}/{n_total}] Downloading: {fname}")
-        
-        try:
-            # Download and clip using GDAL
-            # Use /vsicurl/ to read directly from URL
-            warp_options = gdal.WarpOptions(
-                outputBounds=bbox,  # xmin, ymin, xmax, ymax
-                dstNodata=-9999,
-                creationOptions=['COMPRESS=LZW', 'TILED=YES']
-            )
-            
-            ds = gdal.Warp(out_path, f"/vsicurl/{url}", options=warp_options)
-            
-            if ds is None:
-                print(f"ERROR: Failed to download {fname}")
-                continue
-            
-            ds = None  # Close dataset
-            
-            # Apply scaling and clean data if GIS_functions available
-            if gis is not None:
-                try:
-                    driver, NDV, xsize, ysize, GeoT, Projection = gis.GetGeoInfo(out_path)
-                    Array = gis.OpenAsArray(out_path, nan_values=True)
-                    
-                    # Apply WaPOR conventions:
-                    # - Negative values -> 0 (except NoData)
-                    # - Apply scale factor
-                    Array = np.where(np.isnan(Array), NDV, Array)
-                    Array = np.where(Array < 0, 0, Array)
-                    
-                    if scale not in (1, 1.0, None):
-                        Array = Array * scale
-                    
-                    gis.CreateGeoTiff(out_path, Array.astype('float32'),
-                                    driver, NDV, xsize, ysize, GeoT, Projection)
-                except Exception as e:
-                    print(f"WARNING: Could not apply scaling to {fname}: {e}")
-            
-        except Exception as e:
-            print(f"ERROR downloading {fname}: {e}")
-            if os.path.exists(out_path):
-                os.remove(out_path)
-            continue
+    todo = [(code, url, os.path.join(out_dir, _fname_for(mapset_code, code)))
+            for code, url in wanted]
+    postprocess = _make_postprocess(scale)
+    
+    # All rasters of a mapset share one layout, probe it on the first one
+    creation_options = _creation_options(todo[0][1])
+    
+    # Download and process the rasters concurrently, the work is dominated
+    # by waiting on /vsicurl/ range requests. Progress goes to the throttled
+    # waitbar, the per-raster messages to the debug log.
+    i = 0
+    show_waitbar = throttled_waitbar(n_total) if Waitbar else None
+    if show_waitbar is not None:
+        show_waitbar(i)
+    n_threads = min(n_threads, n_total)
+    initializer = _init_worker if n_threads > 1 else None
+    with ThreadPoolExecutor(max_workers=n_threads,
+                            initializer=initializer) as executor:
+        futures = {
+            executor.submit(_process_one, code, url, out_path, bbox,
+                            postprocess, creation_options):
+                os.path.basename(out_path)
+            for code, url, out_path in todo
+        }
+        for future in as_completed(futures):
+            i += 1
+            if future.result():
+                logger.debug("[%d/%d] Downloaded: %s", i, n_total,
+                             futures[future])
+            if show_waitbar is not None:
+                show_waitbar(i)
     
     if Waitbar:
         print(f"Finished downloading {mapset_code}")
@@ -206,11 +335,24 @@ def _download_mapset(mapset_code, Dir, latlim, lonlim,
 # Public functions matching WaPOR v2 interface
 # =============================================================================
 
-def PCP_daily(Dir, Startdate='2009-01-01', Enddate='2018-12-31',
-              latlim=[-40.05, 40.05], lonlim=[-30.5, 65.05],
-              version=3, Waitbar=1):
-    """
-    Download WaPOR v3 daily precipitation (L1-PCP-E).
+# (function name, mapset code or (level 1, level 2) codes, description)
+_SPECS = [
+    ('PCP_daily', 'L1-PCP-E', 'daily precipitation'),
+    ('PCP_dekadal', 'L1-PCP-D', 'dekadal precipitation'),
+    ('PCP_monthly', 'L1-PCP-M', 'monthly precipitation'),
+    ('PCP_yearly', 'L1-PCP-A', 'annual precipitation'),
+    ('RET_monthly', 'L1-RET-M', 'monthly reference ET'),
+    ('RET_yearly', 'L1-RET-A', 'annual reference ET'),
+    ('AET_dekadal', ('L1-AETI-D', 'L2-AETI-D'), 'dekadal actual ET (AETI)'),
+    ('AET_monthly', ('L1-AETI-M', 'L2-AETI-M'), 'monthly actual ET (AETI)'),
+    ('AET_yearly', ('L1-AETI-A', 'L2-AETI-A'), 'annual actual ET (AETI)'),
+    ('I_dekadal', ('L1-I-D', 'L2-I-D'), 'dekadal interception'),
+    ('I_yearly', ('L1-I-A', 'L2-I-A'), 'annual interception'),
+    ('LCC_yearly', ('L1-LCC-A', 'L2-LCC-A'), 'annual land cover classification'),
+]
+
+_ENTRY_DOC = """
+    Download WaPOR v3 {description} ({codes}).
     
     Parameters
     ----------
@@ -223,204 +365,64 @@ def PCP_daily(Dir, Startdate='2009-01-01', Enddate='2018-12-31',
     latlim : list
         [ymin, ymax] latitude limits
     lonlim : list
-        [xmin, xmax] longitude limits
+        [xmin, xmax] longitude limits{level}
     version : int
         WaPOR version (only 3 supported)
     Waitbar : int
         Show progress (1) or not (0)
+    n_threads : int
+        Number of rasters downloaded concurrently, default is 8
     """
-    if version != 3:
-        print(f"WARNING: Only version 3 supported. Using version 3.")
-    _download_mapset("L1-PCP-E", Dir, latlim, lonlim, Startdate, Enddate, Waitbar)
-
-
-def PCP_dekadal(Dir, Startdate='2009-01-01', Enddate='2018-12-31',
-                latlim=[-40.05, 40.05], lonlim=[-30.5, 65.05],
-                version=3, Waitbar=1):
-    """Download WaPOR v3 dekadal precipitation (L1-PCP-D)."""
-    if version != 3:
-        print(f"WARNING: Only version 3 supported. Using version 3.")
-    _download_mapset("L1-PCP-D", Dir, latlim, lonlim, Startdate, Enddate, Waitbar)
-
-
-def PCP_monthly(Dir, Startdate='2009-01-01', Enddate='2018-12-31',
-                latlim=[-40.05, 40.05], lonlim=[-30.5, 65.05],
-                version=3, Waitbar=1):
-    """Download WaPOR v3 monthly precipitation (L1-PCP-M)."""
-    if version != 3:
-        print(f"WARNING: Only version 3 supported. Using version 3.")
-    _download_mapset("L1-PCP-M", Dir, latlim, lonlim, Startdate, Enddate, Waitbar)
-
-
-def PCP_yearly(Dir, Startdate='2009-01-01', Enddate='2018-12-31',
-               latlim=[-40.05, 40.05], lonlim=[-30.5, 65.05],
-               version=3, Waitbar=1):
-    """Download WaPOR v3 annual precipitation (L1-PCP-A)."""
-    if version != 3:
-        print(f"WARNING: Only version 3 supported. Using version 3.")
-    _download_mapset("L1-PCP-A", Dir, latlim, lonlim, Startdate, Enddate, Waitbar)
-
-
-def RET_monthly(Dir, Startdate='2009-01-01', Enddate='2018-12-31',
-                latlim=[-40.05, 40.05], lonlim=[-30.5, 65.05],
-                version=3, Waitbar=1):
-    """Download WaPOR v3 monthly reference ET (L1-RET-M)."""
-    if version != 3:
-        print(f"WARNING: Only version 3 supported. Using version 3.")
-    _download_mapset("L1-RET-M", Dir, latlim, lonlim, Startdate, Enddate, Waitbar)
-
-
-def RET_yearly(Dir, Startdate='2009-01-01', Enddate='2018-12-31',
-               latlim=[-40.05, 40.05], lonlim=[-30.5, 65.05],
-               version=3, Waitbar=1):
-    """Download WaPOR v3 annual reference ET (L1-RET-A)."""
-    if version != 3:
-        print(f"WARNING: Only version 3 supported. Using version 3.")
-    _download_mapset("L1-RET-A", Dir, latlim, lonlim, Startdate, Enddate, Waitbar)
-
-
-def AET_dekadal(Dir, Startdate='2009-01-01', Enddate='2018-12-31',
-                latlim=[-40.05, 40.05], lonlim=[-30.5, 65.05],
-                level=1, version=3, Waitbar=1):
-    """
-    Download WaPOR v3 dekadal actual ET (AETI).
-    
-    Parameters
-    ----------
-    level : int
-        1 for L1-AETI-D (300m continental), 2 for L2-AETI-D (100m national)
-    """
-    if version != 3:
-        print(f"WARNING: Only version 3 supported. Using version 3.")
-    
-    if level == 1:
-        mapset = "L1-AETI-D"
-    elif level == 2:
-        mapset = "L2-AETI-D"
-    else:
-        raise ValueError(f"Level {level} not supported. Use 1 or 2.")
-    
-    _download_mapset(mapset, Dir, latlim, lonlim, Startdate, Enddate, Waitbar)
-
-
-def AET_monthly(Dir, Startdate='2009-01-01', Enddate='2018-12-31',
-                latlim=[-40.05, 40.05], lonlim=[-30.5, 65.05],
-                level=1, version=3, Waitbar=1):
-    """
-    Download WaPOR v3 monthly actual ET (AETI).
-    
-    Parameters
-    ----------
-    level : int
-        1 for L1-AETI-M (300m continental), 2 for L2-AETI-M (100m national)
-    """
-    if version != 3:
-        print(f"WARNING: Only version 3 supported. Using version 3.")
-    
-    if level == 1:
-        mapset = "L1-AETI-M"
-    elif level == 2:
-        mapset = "L2-AETI-M"
-    else:
-        raise ValueError(f"Level {level} not supported. Use 1 or 2.")
-    
-    _download_mapset(mapset, Dir, latlim, lonlim, Startdate, Enddate, Waitbar)
-
-
-def AET_yearly(Dir, Startdate='2009-01-01', Enddate='2018-12-31',
-               latlim=[-40.05, 40.05], lonlim=[-30.5, 65.05],
-               level=1, version=3, Waitbar=1):
-    """
-    Download WaPOR v3 annual actual ET (AETI).
-    
-    Parameters
-    ----------
-    level : int
-        1 for L1-AETI-A (300m continental), 2 for L2-AETI-A (100m national)
-    """
-    if version != 3:
-        print(f"WARNING: Only version 3 supported. Using version 3.")
-    
-    if level == 1:
-        mapset = "L1-AETI-A"
-    elif level == 2:
-        mapset = "L2-AETI-A"
-    else:
-        raise ValueError(f"Level {level} not supported. Use 1 or 2.")
-    
-    _download_mapset(mapset, Dir, latlim, lonlim, Startdate, Enddate, Waitbar)
-
 
-def I_dekadal(Dir, Startdate='2009-01-01', Enddate='2018-12-31',
-              latlim=[-40.05, 40.05], lonlim=[-30.5, 65.05],
-              level=1, version=3, Waitbar=1):
-    """
-    Download WaPOR v3 dekadal interception.
-    
-    Parameters
-    ----------
+_LEVEL_DOC = """
     level : int
-        1 for L1-I-D (300m), 2 for L2-I-D (100m)
-    """
-    if version != 3:
-        print(f"WARNING: Only version 3 supported. Using version 3.")
-    
-    if level == 1:
-        mapset = "L1-I-D"
-    elif level == 2:
-        mapset = "L2-I-D"
-    else:
-        raise ValueError(f"Level {level} not supported. Use 1 or 2.")
-    
-    _download_mapset(mapset, Dir, latlim, lonlim, Startdate, Enddate, Waitbar)
+        1 for {0} (300m continental), 2 for {1} (100m national)"""
 
 
-def I_yearly(Dir, Startdate='2009-01-01', Enddate='2018-12-31',
-             latlim=[-40.05, 40.05], lonlim=[-30.5, 65.05],
-             level=1, version=3, Waitbar=1):
+def _make_entry(name, mapset, description):
     """
-    Download WaPOR v3 annual interception.
+    Build the public download function for one entry of _SPECS.
     
-    Parameters
-    ----------
-    level : int
-        1 for L1-I-A (300m), 2 for L2-I-A (100m)
+    A single mapset code gives a function without level argument; a
+    (level 1, level 2) pair gives one that dispatches on level.
     """
-    if version != 3:
-        print(f"WARNING: Only version 3 supported. Using version 3.")
-    
-    if level == 1:
-        mapset = "L1-I-A"
-    elif level == 2:
-        mapset = "L2-I-A"
+    if isinstance(mapset, tuple):
+        def entry(Dir, Startdate=FIRST_DATE, Enddate='2018-12-31',
+                  latlim=[-40.05, 40.05], lonlim=[-30.5, 65.05],
+                  level=1, version=3, Waitbar=1, n_threads=8):
+            if version != 3:
+                print(f"WARNING: Only version 3 supported. Using version 3.")
+            
+            if level not in (1, 2):
+                raise ValueError(f"Level {level} not supported. Use 1 or 2.")
+            
+            Startdate = clamp_startdate(Startdate)
+            _download_mapset(mapset[level - 1], Dir, latlim, lonlim,
+                             Startdate, Enddate, Waitbar, n_threads=n_threads)
+        
+        entry.__doc__ = _ENTRY_DOC.format(description=description,
+                                          codes=' / '.join(mapset),
+                                          level=_LEVEL_DOC.format(*mapset))
     else:
-        raise ValueError(f"Level {level} not supported. Use 1 or 2.")
+        def entry(Dir, Startdate=FIRST_DATE, Enddate='2018-12-31',
+                  latlim=[-40.05, 40.05], lonlim=[-30.5, 65.05],
+                  version=3, Waitbar=1, n_threads=8):
+            if version != 3:
+                print(f"WARNING: Only version 3 supported. Using version 3.")
+            Startdate = clamp_startdate(Startdate)
+            _download_mapset(mapset, Dir, latlim, lonlim, Startdate, Enddate,
+                             Waitbar, n_threads=n_threads)
+        
+        entry.__doc__ = _ENTRY_DOC.format(description=description,
+                                          codes=mapset, level='')
     
-    _download_mapset(mapset, Dir, latlim, lonlim, Startdate, Enddate, Waitbar)
+    entry.__name__ = entry.__qualname__ = name
+    return entry
 
 
-def LCC_yearly(Dir, Startdate='2009-01-01', Enddate='2018-12-31',
-               latlim=[-40.05, 40.05], lonlim=[-30.5, 65.05],
-               level=1, version=3, Waitbar=1):
-    """
-    Download WaPOR v3 annual land cover classification.
-    
-    Parameters
-    ----------
-    level : int
-        1 for L1-LCC-A (300m), 2 for L2-LCC-A (100m)
-    """
-    if version != 3:
-        print(f"WARNING: Only version 3 supported. Using version 3.")
-    
-    if level == 1:
-        mapset = "L1-LCC-A"
-    elif level == 2:
-        mapset = "L2-LCC-A"
-    else:
-        raise ValueError(f"Level {level} not supported. Use 1 or 2.")
-    
-    _download_mapset(mapset, Dir, latlim, lonlim, Startdate, Enddate, Waitbar)
+for _name, _mapset, _description in _SPECS:
+    globals()[_name] = _make_entry(_name, _mapset, _description)
+del _name, _mapset, _description
 
 
 # =============================================================================
@@ -45,40 +45,59 @@ Contact: Based on IHE Delft WaPOR v2 module
 Repository: https://github.com/wateraccounting/watools
 """
 
-# Import all main functions from WaPOR_v3
-from .WaPOR_v3 import (
+import importlib
+
+# The download functions are loaded from WaPOR_v3 on first use (PEP 562), so
+# importing the package for the API helpers does not pull in GDAL
+_LAZY = {
     # Precipitation
-    PCP_daily,
-    PCP_dekadal,
-    PCP_monthly,
-    PCP_yearly,
+    'PCP_daily': '.WaPOR_v3',
+    'PCP_dekadal': '.WaPOR_v3',
+    'PCP_monthly': '.WaPOR_v3',
+    'PCP_yearly': '.WaPOR_v3',
     
     # Reference ET
-    RET_monthly,
-    RET_yearly,
+    'RET_monthly': '.WaPOR_v3',
+    'RET_yearly': '.WaPOR_v3',
     
     # Actual ET (AETI)
-    AET_dekadal,
-    AET_monthly,
-    AET_yearly,
+    'AET_dekadal': '.WaPOR_v3',
+    'AET_monthly': '.WaPOR_v3',
+    'AET_yearly': '.WaPOR_v3',
     
     # Interception
-    I_dekadal,
-    I_yearly,
+    'I_dekadal': '.WaPOR_v3',
+    'I_yearly': '.WaPOR_v3',
     
     # Land Cover Classification
-    LCC_yearly,
+    'LCC_yearly': '.WaPOR_v3',
     
     # Helper functions
-    list_available_mapsets,
-)
+    'list_available_mapsets': '.WaPOR_v3',
+}
+
+
+def __getattr__(name):
+    if name not in _LAZY:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(_LAZY[name], __name__), name)
+    globals()[name] = value  # Later lookups skip __getattr__
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY))
+
 
 # Import API helpers for advanced usage
 from .waporv3_api import (
     BASE_URL,
     get_mapsets,
     get_rasters,
+    get_rasters_by_date,
     filter_rasters_by_date,
+    clear_cache,
+    RasterCatalog,
 )
 
 __all__ = [
@@ -108,12 +127,10 @@ __all__ = [
     'list_available_mapsets',
     'get_mapsets',
     'get_rasters',
+    'get_rasters_by_date',
+    'clear_cache',
+    'RasterCatalog',
 ]
 
 __version__ = '3.0.0'
 __doc__ = """WaPOR v3 data collection module - no API token required"""
-
-# Print info when module is imported
-print("WaPOR v3 module loaded")
-print("No API token required - uses public COG files")
-print("Use list_available_mapsets() to see all available datasets")
\ No newline at end of file
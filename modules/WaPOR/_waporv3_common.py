@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+"""
+GDAL setup, raster post-processing and progress display shared by
+WaPOR_v3 and the per-product pipeline.
+
+WaPOR_v3 is also used as a plain module next to waporv3_api.py, outside of
+the WaPOR package, so this module only depends on GDAL and NumPy:
+
+- configure_gdal   : threading, block cache and /vsicurl/ options, once
+- _init_worker     : initializer of the download worker threads
+- _clip_and_scale  : WaPOR value conventions, in place on a float32 array
+- clamp_startdate  : move a start date up to the start of WaPOR v3
+- throttled_waitbar: progress bar redrawn at most every 0.1 s
+"""
+
+from datetime import datetime
+import time
+
+import numpy as np
+from osgeo import gdal
+
+try:
+    import numexpr as ne
+except ImportError:
+    ne = None
+
+
+# First date covered by the WaPOR v3 mapsets
+FIRST_DATE = '2018-01-01'
+
+
+def clamp_startdate(Startdate):
+    """
+    Return Startdate, or FIRST_DATE with a warning if Startdate is earlier.
+
+    Parameters
+    ----------
+    Startdate : str
+        Start date in 'YYYY-MM-DD' format. Anything else, e.g. '' for no
+        date filter, is returned as is, for the caller to handle.
+    """
+    try:
+        start = datetime.strptime(Startdate, '%Y-%m-%d')
+    except (TypeError, ValueError):
+        return Startdate
+    if start < datetime.strptime(FIRST_DATE, '%Y-%m-%d'):
+        print(f"WARNING: WaPOR v3 data starts at {FIRST_DATE}, "
+              f"using {FIRST_DATE} instead of {Startdate}")
+        return FIRST_DATE
+    return Startdate
+
+
+_configured = False
+
+
+def configure_gdal():
+    """
+    Set the process-wide GDAL options of the WaPOR v3 downloads.
+
+    GDAL warps with every core and keeps a quarter of the RAM as block
+    cache; download workers fall back to one warp thread each, see
+    _init_worker. Remote COGs are read through /vsicurl/: only open .tif
+    URLs, do not probe the server for sidecar files or issue a HEAD before
+    each GET, cache fetched blocks, and merge adjacent tile ranges into
+    single requests multiplexed over HTTP/2. Calling it again is a no-op.
+    """
+    global _configured
+    if _configured:
+        return
+    gdal.SetConfigOption('GDAL_NUM_THREADS', 'ALL_CPUS')
+    gdal.SetConfigOption('GDAL_CACHEMAX', '25%')
+
+    gdal.SetConfigOption('CPL_VSIL_CURL_USE_HEAD', 'NO')
+    gdal.SetConfigOption('GDAL_DISABLE_READDIR_ON_OPEN', 'EMPTY_DIR')
+    gdal.SetConfigOption('CPL_VSIL_CURL_ALLOWED_EXTENSIONS', '.tif,.tiff')
+    gdal.SetConfigOption('VSI_CACHE', 'TRUE')
+    gdal.SetConfigOption('VSI_CACHE_SIZE', '100000000')
+    gdal.SetConfigOption('GDAL_HTTP_MERGE_CONSECUTIVE_RANGES', 'YES')
+    gdal.SetConfigOption('GDAL_HTTP_MULTIPLEX', 'YES')
+    gdal.SetConfigOption('GDAL_HTTP_VERSION', '2')
+    _configured = True
+
+
+def _init_worker():
+    """
+    Keep GDAL single-threaded inside each download worker, so a pool of
+    workers does not oversubscribe the cores on top of GDAL's own threads.
+    """
+    gdal.SetThreadLocalConfigOption('GDAL_NUM_THREADS', '1')
+
+
+def _clip_and_scale(arr, NDV, scale_factor):
+    """
+    Set negative values to 0 and apply scale_factor to a float32 array in
+    place, keeping NaN (no-data) pixels as NDV. Uses a single fused numexpr
+    pass when numexpr is installed. A scale_factor of None skips the
+    multiplication, for unscaled (e.g. categorical) mapsets.
+    """
+    if ne is not None:
+        if scale_factor is None:
+            ne.evaluate("where(arr != arr, ndv, where(arr < 0, 0, arr))",
+                        local_dict={'arr': arr, 'ndv': np.float32(NDV)},
+                        out=arr, casting='unsafe')
+        else:
+            ne.evaluate("where(arr != arr, ndv, where(arr < 0, 0, arr * scale))",
+                        local_dict={'arr': arr,
+                                    'ndv': np.float32(NDV),
+                                    'scale': np.float32(scale_factor)},
+                        out=arr, casting='unsafe')
+        return arr
+
+    mask = np.isnan(arr)
+    np.clip(arr, 0, None, out=arr)
+    if scale_factor is not None:
+        arr *= scale_factor
+    arr[mask] = NDV
+    return arr
+
+
+def throttled_waitbar(total_amount, interval=0.1):
+    """
+    Progress bar that redraws at most once per interval.
+
+    Parameters
+    ----------
+    total_amount : int
+        Number of rasters of the run.
+    interval : float
+        Minimum number of seconds between two redraws, default is 0.1. The
+        final state (amount == total_amount) is always drawn.
+
+    Returns
+    -------
+    show : callable or None
+        show(amount) draws the bar, None if WaitbarConsole is unavailable.
+    """
+    try:
+        from WaPOR import WaitbarConsole
+    except ImportError:
+        try:
+            import WaitbarConsole
+        except ImportError:
+            return None
+
+    last_update = None
+
+    def show(amount):
+        nonlocal last_update
+        now = time.monotonic()
+        if (last_update is not None and now - last_update <= interval
+                and amount != total_amount):
+            return
+        last_update = now
+        WaitbarConsole.printWaitBar(
+            amount, total_amount,
+            prefix='Progress:',
+            suffix='Complete',
+            length=50
+        )
+
+    return show
@@ -0,0 +1,368 @@
+# -*- coding: utf-8 -*-
+"""
+Shared download pipeline for the WaPOR v3 per-product modules.
+
+AET_dekadal, I_dekadal, PCP_monthly and PCP_yearly all list the rasters of
+a mapset, filter them by date, then download, crop and scale every raster
+into a GeoTIFF. This module holds that pipeline once:
+
+- select_by_date   : dated rasters of a listing within a date window
+- download_session : pooled requests.Session for raw downloads
+- with_retry       : retry a per-raster function with jittered backoff
+- process_mapset   : list, filter and process a mapset concurrently
+"""
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import functools
+import logging
+import os
+import random
+import threading
+import time
+import uuid
+
+from osgeo import gdal
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import tenacity
+except ImportError:
+    tenacity = None
+
+from WaPOR import GIS_functions as gis
+from WaPOR._waporv3_common import (_clip_and_scale, _init_worker,
+                                   configure_gdal, throttled_waitbar)
+from WaPOR.waporv3_api import (_retry, base_url, collect_responses_cached,
+                               filter_rasters_by_date, parse_date_from_code)
+
+
+logger = logging.getLogger(__name__)
+
+# Creation options of the final float32 GeoTIFFs: tiled so later crops are
+# range reads, DEFLATE with the floating point predictor at the fastest level.
+# Each output is encoded and written by GDAL in its own download worker, so
+# the writes of concurrent rasters already overlap; intermediates never
+# touch the disk (/vsimem/).
+GTIFF_OPTIONS = ['TILED=YES', 'BLOCKXSIZE=512', 'BLOCKYSIZE=512',
+                 'COMPRESS=DEFLATE', 'PREDICTOR=3', 'ZLEVEL=1']
+
+configure_gdal()
+
+# One pooled session for all raw downloads, so consecutive rasters (and the
+# download workers) reuse keep-alive connections to the WaPOR host. 429 and
+# 5xx answers are retried with the same policy as the API session.
+download_session = requests.Session()
+download_session.mount('https://', HTTPAdapter(
+    pool_connections=16,
+    pool_maxsize=16,
+    max_retries=_retry()
+))
+
+
+def select_by_date(rasters, start_dt, end_dt, is_sorted=False):
+    """
+    Select the rasters dated within [start_dt, end_dt], with their date.
+
+    The listing is filtered by waporv3_api.filter_rasters_by_date, by
+    bisection if is_sorted (a listing sorted by code, as returned by
+    collect_responses); codes without a date are left out.
+
+    Returns
+    -------
+    list
+        (date, code, url) tuples of the selected rasters.
+    """
+    return [(parse_date_from_code(code), code, url)
+            for code, url in filter_rasters_by_date(
+                rasters, start_dt, end_dt, is_sorted=is_sorted,
+                keep_undated=False)]
+
+
+def _download_file(url, output_path, chunk_size=1024 * 1024):
+    """
+    Stream a remote file to disk over the shared download session.
+
+    Parameters
+    ----------
+    url : str
+        Download URL
+    output_path : str
+        Output file path
+    chunk_size : int
+        Download chunk size in bytes
+
+    Returns
+    -------
+    bool
+        True if successful, False otherwise
+    """
+    try:
+        with download_session.get(url, stream=True, timeout=300) as response:
+            response.raise_for_status()
+            with open(output_path, 'wb') as f:
+                for chunk in response.iter_content(chunk_size=chunk_size):
+                    if chunk:
+                        f.write(chunk)
+        return True
+
+    except Exception as e:
+        print(f"    Download error: {e}")
+        if os.path.exists(output_path):
+            try:
+                os.remove(output_path)
+            except Exception:
+                pass
+        return False
+
+
+def with_retry(fn, attempts=3, initial=1.0, maximum=10.0):
+    """
+    Wrap fn so IOError and RuntimeError are retried with exponential
+    backoff plus jitter (1 s, 2 s, ... capped at maximum seconds).
+
+    Uses tenacity when it is installed. The last failure is re-raised.
+
+    Parameters
+    ----------
+    fn : callable
+        Function to wrap, typically a per-raster worker.
+    attempts : int
+        Total number of calls, default is 3.
+    initial, maximum : float
+        First and largest wait between calls, in seconds.
+    """
+    retry_on = (IOError, RuntimeError)
+
+    if tenacity is not None:
+        return tenacity.retry(
+            stop=tenacity.stop_after_attempt(attempts),
+            wait=tenacity.wait_exponential_jitter(initial, maximum),
+            retry=tenacity.retry_if_exception_type(retry_on),
+            reraise=True
+        )(fn)
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        for attempt in range(attempts):
+            try:
+                return fn(*args, **kwargs)
+            except retry_on as e:
+                if attempt == attempts - 1:
+                    raise
+                wait = min(initial * 2 ** attempt, maximum)
+                wait += random.uniform(0, initial)
+                logger.debug("Attempt %d failed (%s), retrying in %.1f s",
+                             attempt + 1, e, wait)
+                time.sleep(wait)
+
+    return wrapper
+
+
+def _overlaps(ds, bbox):
+    """Check whether bbox (xmin, ymin, xmax, ymax) intersects a dataset."""
+    gt = ds.GetGeoTransform()
+    xmin = gt[0]
+    ymax = gt[3]
+    xmax = xmin + ds.RasterXSize * gt[1]
+    ymin = ymax + ds.RasterYSize * gt[5]
+    return not (bbox[2] < xmin or bbox[0] > xmax or
+                bbox[3] < ymin or bbox[1] > ymax)
+
+
+def _process_one(code, url, out_path, bbox, scale_factor):
+    """
+    Download, crop and scale a single raster to out_path.
+
+    Returns
+    -------
+    str
+        'skipped' if the bbox is outside the raster, 'done' otherwise.
+
+    Raises
+    ------
+    IOError, RuntimeError
+        If the download, open or crop failed, so with_retry retries it.
+        No partial out_path is left behind.
+    """
+    logger.debug("Downloading + cropping %s", code)
+
+    tmp_name = code.replace('.', '_').replace('/', '_')
+    tmp_download = os.path.join(os.path.dirname(out_path),
+                                f"_download_{tmp_name}.tif")
+    tmp_cropped = f"/vsimem/_cropped_{uuid.uuid4().hex}.tif"
+
+    try:
+        # Step 1: Open the source. Streaming the COG through /vsicurl/ only
+        # fetches the tiles covering bbox; a full local copy downloaded over
+        # the shared session is the fallback if the range reads fail.
+        src = gdal.Open(f"/vsicurl/{url}")
+        if src is None:
+            if not _download_file(url, tmp_download):
+                raise IOError(f"Failed to download {code}")
+            src = gdal.Open(tmp_download)
+        if src is None:
+            raise RuntimeError(f"GDAL could not open {code}")
+        if not _overlaps(src, bbox):
+            print(f"  BBOX outside raster extent, skipping {code}")
+            return 'skipped'
+
+        # Step 2: Crop into memory
+        warp_opts = gdal.WarpOptions(
+            outputBounds=bbox,
+            dstNodata=-9999,
+            multithread=True,
+            warpMemoryLimit=512 * 1024 * 1024
+        )
+        ds = gdal.Warp(tmp_cropped, src, options=warp_opts)
+        if ds is None:
+            raise RuntimeError(f"GDAL Warp failed for {code}")
+        ds = None  # Flush to /vsimem/
+        src = None
+
+        # Step 3: Read, scale, and save
+        driver, NDV, xsize, ysize, GeoT, Projection = gis.GetGeoInfo(tmp_cropped)
+        arr = gis.OpenAsArray(tmp_cropped, dtype='float32', nan_values=True)
+
+        _clip_and_scale(arr, NDV, scale_factor)
+
+        gis.CreateGeoTiff(out_path, arr,
+                          driver, NDV, xsize, ysize, GeoT, Projection,
+                          options=GTIFF_OPTIONS)
+
+    except Exception:
+        if os.path.exists(out_path):
+            try:
+                os.remove(out_path)
+            except Exception:
+                pass
+        raise
+
+    finally:
+        # Clean up temporary files
+        if os.path.exists(tmp_download):
+            try:
+                os.remove(tmp_download)
+            except Exception:
+                pass
+        gdal.Unlink(tmp_cropped)
+
+    return 'done'
+
+
+def process_mapset(mapset_code, filename_fn, out_dir, bbox, start_dt, end_dt,
+                   waitbar=1, max_workers=8, scale_factor=0.1,
+                   no_cache=False):
+    """
+    Download, crop and scale all rasters of a mapset within a date range.
+
+    Parameters
+    ----------
+    mapset_code : str
+        WaPOR v3 mapset code (e.g. 'L1-PCP-M', 'L2-AETI-D').
+    filename_fn : callable
+        filename_fn(dt, code) returns the output file name of a raster.
+    out_dir : str
+        Directory where the GeoTIFFs are stored, created if needed.
+    bbox : list
+        [xmin, ymin, xmax, ymax] bounds to crop to.
+    start_dt, end_dt : datetime.date
+        Date range (inclusive).
+    waitbar : int (0 or 1)
+        If 1, prints a simple textual progress bar.
+    max_workers : int
+        Number of rasters processed concurrently, default is 8.
+    scale_factor : float
+        Multiplier converting raw values to physical units, default is 0.1.
+    no_cache : bool
+        If True, query the raster listing from the API even if a cached
+        listing from the last day exists.
+
+    Returns
+    -------
+    str or None
+        out_dir, or None if no rasters could be listed or selected. Rasters
+        that failed are reported, and left out of out_dir.
+    """
+    # List all rasters for the mapset
+    mapset_url = f"{base_url}/{mapset_code}/rasters"
+
+    try:
+        all_rasters = collect_responses_cached(mapset_url, mapset_code,
+                                               info=["code", "downloadUrl"],
+                                               no_cache=no_cache)
+    except Exception as e:
+        print("ERROR: cannot get list of available data from WaPOR v3")
+        print(e)
+        return None
+
+    if not all_rasters:
+        print("ERROR: No rasters available for this mapset")
+        return None
+
+    # Filter rasters by date
+    selected = select_by_date(all_rasters, start_dt, end_dt, is_sorted=True)
+
+    if len(selected) == 0:
+        print("No rasters found within requested date range.")
+        return None
+
+    selected.sort(key=lambda x: x[0])
+
+    # Prepare output directory
+    os.makedirs(out_dir, exist_ok=True)
+
+    # Drop rasters already on disk, listed once instead of a stat per raster
+    existing = {e.name for e in os.scandir(out_dir)}
+    todo = []
+    for dt, code, url in selected:
+        fname = filename_fn(dt, code)
+        if fname in existing:
+            logger.debug("File exists, skipping %s", fname)
+        else:
+            todo.append((code, url, os.path.join(out_dir, fname)))
+
+    # Progress bar, updated as the workers complete
+    total_amount = len(selected)
+    amount = total_amount - len(todo)
+    lock = threading.Lock()
+    show_waitbar = throttled_waitbar(total_amount) if waitbar == 1 else None
+    if show_waitbar is not None:
+        show_waitbar(amount)
+
+    def _update_waitbar(future):
+        nonlocal amount
+        with lock:
+            amount += 1
+            if show_waitbar is not None:
+                show_waitbar(amount)
+
+    # Process rasters concurrently; each worker downloads, crops and scales
+    # one raster, retrying transient failures with backoff. A single worker
+    # keeps GDAL's ALL_CPUS threading.
+    initializer = _init_worker if max_workers > 1 else None
+    with ThreadPoolExecutor(max_workers=max_workers,
+                            initializer=initializer) as executor:
+        process_one = with_retry(_process_one)
+        futures = {}
+        for code, url, out_path in todo:
+            future = executor.submit(process_one, code, url, out_path,
+                                     bbox, scale_factor)
+            future.add_done_callback(_update_waitbar)
+            futures[future] = code
+
+        failed = []
+        for future in as_completed(futures):
+            try:
+                future.result()
+            except Exception as e:
+                print(f"  ERROR processing {futures[future]}: {e}")
+                failed.append(futures[future])
+
+    if failed:
+        print(f"WARNING: {len(failed)} of {len(todo)} rasters of "
+              f"{mapset_code} failed, run again to retry them")
+        logger.warning("Failed rasters of %s: %s", mapset_code,
+                       ", ".join(sorted(failed)))
+
+    return out_dir
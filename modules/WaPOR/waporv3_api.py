@@ -5,18 +5,279 @@ Based on official FAO WaPOR v3 tutorial
 No authentication required - uses public COG files
 """
 
+import bisect
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime
+from functools import lru_cache
+import gzip
+import json
+import numpy as np
+import os
+import re
 import requests
+from requests.adapters import HTTPAdapter
 import time
+from urllib.parse import parse_qs, parse_qsl, urlencode, urlsplit, urlunsplit
+from urllib3.util.retry import Retry
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 # Base URL for WaPOR v3
 BASE_URL = "https://data.apps.fao.org/gismgr/api/v2/catalog/workspaces/WAPOR-3/mapsets"
 base_url = BASE_URL  # backward compatibility with older modules
 
+# On-disk cache of mapset listings. WaPOR v3 publishes new rasters at most
+# dekadally, so a listing is reused for a day.
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "wapor", "mapsets")
+CACHE_TTL = 24 * 3600  # seconds
+
+# Listings already returned in this process,
+# (url, info) -> (time, records, sorted)
+_MEMO = {}
+
+# Listings of at least this many rasters are date-filtered with pandas
+_VECTORIZE_MIN = 200
+
+# Number of listing pages requested at the same time
+PAGE_CONCURRENCY = 8
+
+# Retries of transient failures (connection errors, 429 and 5xx): urllib3
+# backs off exponentially (0.3 s, 0.6 s, 1.2 s) and honours a Retry-After
+# header of the server
+RETRIES = 3
+
+
+def _retry():
+    """urllib3 Retry policy of the API session."""
+    kwargs = dict(total=RETRIES, backoff_factor=0.3,
+                  status_forcelist=[429, 500, 502, 503, 504],
+                  respect_retry_after_header=True)
+    try:
+        return Retry(allowed_methods=["GET", "HEAD"], **kwargs)
+    except TypeError:
+        # urllib3 < 1.26
+        return Retry(method_whitelist=["GET", "HEAD"], **kwargs)
+
 
-def collect_responses(url, info=["code"]):
+# One keep-alive session for all API requests, so the pages of a listing
+# share TLS connections. Transient failures are retried by urllib3.
+_SESSION = requests.Session()
+_SESSION.mount("https://", HTTPAdapter(
+    pool_connections=16, pool_maxsize=16, max_retries=_retry()))
+_SESSION.headers["Accept-Encoding"] = "gzip"
+
+
+class ListingError(IOError):
+    """A page of a listing could not be fetched, the listing is incomplete."""
+
+
+def _fetch_page(url_, missing_ok=False):
     """
-    Collect paginated API responses from WaPOR v3.
+    GET one page of a listing over the shared session.
+
+    Returns the "response" envelope of the page. Raises ListingError if the
+    request failed, after the session's retries for retryable errors. With
+    missing_ok, a 404 is an empty page instead: a page requested ahead of
+    the next links may lie past the end of the listing.
+    """
+    try:
+        response = _SESSION.get(url_, timeout=30)
+        response.raise_for_status()
+    except requests.exceptions.RetryError as e:
+        # urllib3 raised MaxRetryError on a retryable status (429/5xx)
+        reason = getattr(e.args[0], "reason", e) if e.args else e
+        raise ListingError(f"Error fetching {url_}: gave up after {RETRIES} "
+                           f"retries ({reason})") from e
+    except requests.exceptions.HTTPError as e:
+        # Not a retried status, so the first answer is the final one
+        if missing_ok and e.response is not None \
+                and e.response.status_code == 404:
+            return {}
+        raise ListingError(f"Error fetching {url_}: {e}") from e
+    except requests.exceptions.RequestException as e:
+        raise ListingError(
+            f"Error fetching data after {RETRIES} retries: {e}") from e
+
+    # WaPOR v3 nests data under "response" key. Parse the raw bytes, with
+    # orjson when available, instead of decoding them to str first
+    return _loads(response.content).get("response", {})
+
+
+def _records(items, info):
+    """Fields of info from each item, or the items themselves for "all"."""
+    if info == "all":
+        return items
+    elif isinstance(info, list):
+        # Runs for every item of every page: common field counts get a
+        # tuple display, and no generator is created per item
+        if len(info) == 1:
+            f0, = info
+            return [(item.get(f0),) for item in items]
+        if len(info) == 2:
+            f0, f1 = info
+            return [(item.get(f0), item.get(f1)) for item in items]
+        return [tuple([item.get(field) for field in info]) for item in items]
+    return []
+
+
+def _next_href(data):
+    """href of the rel='next' link of a page, None on the last page."""
+    return next((x["href"] for x in data.get("links", [])
+                 if x["rel"] == "next"), None)
+
+
+def _page_number(url_):
+    """Value of the integer 'page' query parameter of url_, or None."""
+    query = parse_qs(urlsplit(url_).query)
+    try:
+        return int(query["page"][0])
+    except (KeyError, IndexError, ValueError):
+        return None
+
+
+def _with_page(url_, page):
+    """url_ with its 'page' query parameter set to page."""
+    parts = urlsplit(url_)
+    query = [(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+             if k != "page"]
+    query.append(("page", str(page)))
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
+
+def _total_items(data):
+    """totalItems of a listing from its first page, None if not given."""
+    try:
+        return int(data["totalItems"])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def _page_count(data):
+    """Number of pages of a listing from its first page, None if unknown."""
+    total = _total_items(data)
+    try:
+        size = int(data["pageSize"])
+    except (KeyError, TypeError, ValueError):
+        return None
+    if total is None or size <= 0:
+        return None
+    return -(-total // size)
+
+
+def _iter_pages(url_, info, concurrency, last_page=None):
+    """
+    Records of the numbered pages from url_ onwards, in page order.
+
+    If last_page is known, all pages up to it are requested up front,
+    concurrency at a time. Otherwise the pages are requested in batches of
+    concurrency, until a page is empty or has no next link. Only the first
+    page of a batch is known to exist, so a 404 for the others ends the
+    listing quietly.
+    """
+    page = _page_number(url_)
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        if last_page is not None:
+            urls = [_with_page(url_, p) for p in range(page, last_page + 1)]
+            for data in executor.map(_fetch_page, urls):
+                items = data.get("items", [])
+                if not items:
+                    return
+                yield from _records(items, info)
+            return
+
+        while True:
+            urls = [_with_page(url_, p) for p in range(page, page + concurrency)]
+            ahead = [False] + [True] * (concurrency - 1)
+            for data in executor.map(_fetch_page, urls, ahead):
+                items = data.get("items", [])
+                if not items:
+                    return
+                yield from _records(items, info)
+                if _next_href(data) is None:
+                    return
+            page += concurrency
+
+
+def iter_responses(url, info=["code"], concurrency=PAGE_CONCURRENCY):
+    """
+    Iterate over paginated API responses from WaPOR v3, page by page.
     Handles pagination using 'links' with rel='next'.
+
+    Once the next links turn out to be numbered pages (a 'page' query
+    parameter), the following pages are requested concurrently instead of
+    one round trip at a time; all at once if the first page gives
+    totalItems and pageSize. Records are yielded as their page arrives,
+    so a caller can start filtering before the listing is complete.
+    
+    Parameters
+    ----------
+    url : str
+        Initial URL to query
+    info : list or str
+        List of field names to extract from each item, or "all" for complete items
+    concurrency : int
+        Number of pages requested at the same time, default is 8. Use 1 to
+        follow the next links one by one.
+        
+    Yields
+    ------
+    tuple or dict
+        If info is a list: a tuple with the requested fields
+        If info is "all": the complete item dictionary
+        
+    Example
+    -------
+    >>> for code, url in iter_responses(mapset_url, info=["code", "downloadUrl"]):
+    ...     print(code)
+
+    Raises
+    ------
+    ListingError
+        If a page cannot be fetched. The records yielded so far are only
+        part of the listing.
+    """
+    return _iter_listing(url, info, concurrency)
+
+
+def _iter_listing(url, info, concurrency, first=None):
+    """iter_responses, reusing first as the page of url if given."""
+    # Start at url and follow the next links, scanning them once per page
+    url_ = url
+    data = None
+    while url_:
+        page = _page_number(url_) if concurrency > 1 else None
+        if page is not None:
+            # After the first page, its totalItems and pageSize tell which
+            # page is the last one
+            count = _page_count(data) if data is not None else None
+            last_page = page + count - 2 if count is not None else None
+            yield from _iter_pages(url_, info, concurrency, last_page)
+            return
+        
+        if first is not None:
+            data, first = first, None
+        else:
+            data = _fetch_page(url_)
+        
+        # Extract items
+        items = data.get("items", [])
+        if not items:
+            return
+            
+        # Extract requested fields from each item
+        yield from _records(items, info)
+        url_ = _next_href(data)
+
+
+def collect_responses(url, info=["code"], concurrency=PAGE_CONCURRENCY,
+                      sort=True):
+    """
+    Collect paginated API responses from WaPOR v3.
+    Collects iter_responses into a list.
     
     Parameters
     ----------
@@ -24,70 +285,228 @@ def collect_responses(url, info=["code"]):
         Initial URL to query
     info : list or str
         List of field names to extract from each item, or "all" for complete items
+    concurrency : int
+        Number of pages requested at the same time, default is 8. Use 1 to
+        follow the next links one by one.
+    sort : bool
+        If True (default), sort the tuples. Pass False when the order does
+        not matter, e.g. when the records are filtered next.
         
     Returns
     -------
     list
         If info is a list: returns list of tuples with requested fields
         If info is "all": returns list of complete item dictionaries
+        If a page cannot be fetched, the error is printed and the records
+        of the pages before it are returned.
         
     Example
     -------
     >>> mapsets = collect_responses(BASE_URL, info=["code", "caption"])
     >>> rasters = collect_responses(mapset_url, info=["code", "downloadUrl"])
     """
-    # Initialize with a dummy "next" link to start the loop
-    data = {"links": [{"rel": "next", "href": url}]}
+    return _collect(url, info, concurrency, sort)[0]
+
+
+def _collect(url, info, concurrency=PAGE_CONCURRENCY, sort=True, first=None,
+             verbose=True):
+    """
+    collect_responses, also telling whether every page was fetched.
+    first is the already fetched page of url, if any.
+
+    Returns
+    -------
+    tuple
+        (output, complete). If a page failed, the error is printed (if
+        verbose) and output holds the records of the pages before it.
+    """
     output = []
-    
-    while "next" in [x["rel"] for x in data.get("links", [])]:
-        # Get the URL for the next page
-        url_ = [x["href"] for x in data["links"] if x["rel"] == "next"][0]
-        
-        # Make request with retry logic
-        for attempt in range(3):
-            try:
-                response = requests.get(url_, timeout=30)
-                response.raise_for_status()
-                break
-            except requests.exceptions.RequestException as e:
-                if attempt == 2:
-                    print(f"Error fetching data after 3 attempts: {e}")
-                    return output
-                time.sleep(2)
-        
-        # Parse response - WaPOR v3 nests data under "response" key
-        json_data = response.json()
-        data = json_data.get("response", {})
-        
-        # Extract items
-        items = data.get("items", [])
-        if not items:
-            break
-            
-        # Extract requested fields from each item
-        if info == "all":
-            output.extend(items)
-        elif isinstance(info, list):
-            for item in items:
-                record = tuple(item.get(field) for field in info)
-                output.append(record)
+    complete = True
+    try:
+        output.extend(_iter_listing(url, info, concurrency, first))
+    except ListingError as e:
+        if verbose:
+            print(e)
+        complete = False
         
     # Sort if we extracted specific fields
-    if isinstance(info, list) and info != "all":
-        output = sorted(output)
+    if sort and isinstance(info, list) and info != "all":
+        output.sort()
         
-    return output
+    return output, complete
+
+
+def _dumps(obj):
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj).encode("utf-8")
+
 
+def _loads(data):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data.decode("utf-8"))
 
-def get_mapsets(include_caption=True):
+
+def collect_responses_cached(url, cache_name, info=["code"], no_cache=False,
+                             sort=True):
+    """
+    collect_responses with an on-disk cache of the result.
+
+    The result is stored gzipped in CACHE_DIR/<cache_name>.json.gz and
+    reused for CACHE_TTL seconds, as long as it was collected for the same
+    url and info. After that the first page is requested again: if it
+    reports the same totalItems as the cached listing, the cache is kept for
+    another CACHE_TTL, otherwise the listing is collected again starting
+    from that page. Listings without totalItems are collected again. Within
+    one process the result is also kept in memory, so repeated calls skip
+    the cache file.
+
+    Parameters
+    ----------
+    url : str
+        Initial URL to query
+    cache_name : str
+        Name of the cache file, typically the mapset code
+    info : list or str
+        Passed on to collect_responses
+    no_cache : bool
+        If True, ignore any cached result and query the API. The fresh
+        result still replaces the cache.
+    sort : bool
+        Passed on to collect_responses. An unsorted cached result is sorted
+        when a later call asks for sort=True.
+
+    Returns
+    -------
+    list
+        Same as collect_responses. A listing with a failed page is not
+        cached.
+    """
+    return _collect_cached(url, cache_name, info, no_cache, sort)[0]
+
+
+def _collect_cached(url, cache_name, info, no_cache, sort, verbose=True):
+    """
+    collect_responses_cached, also telling whether the listing is complete.
+
+    Returns
+    -------
+    tuple
+        (records, complete). complete is False if a page failed; errors
+        are only printed if verbose.
+    """
+    cache_file = os.path.join(CACHE_DIR, f"{cache_name}.json.gz")
+    key = (url, tuple(info) if isinstance(info, list) else info)
+
+    if not no_cache:
+        hit = _MEMO.get(key)
+        if hit is not None and time.time() - hit[0] < CACHE_TTL:
+            if sort and not hit[2]:
+                hit = (hit[0], sorted(hit[1]), True)
+                _MEMO[key] = hit
+            return list(hit[1]), True
+
+    cached = None
+    if not no_cache:
+        try:
+            age = time.time() - os.path.getmtime(cache_file)
+            with open(cache_file, "rb") as f:
+                cached = _loads(gzip.decompress(f.read()))
+            if cached["url"] != url or cached["info"] != info:
+                cached = None
+        except (OSError, ValueError, KeyError):
+            cached = None  # Missing or unreadable cache
+
+    first = None
+    if cached is not None:
+        fresh = age < CACHE_TTL
+        if not fresh and cached.get("total") is not None:
+            # totalItems covers every page, unlike an ETag of the first one
+            try:
+                first = _fetch_page(url)
+            except ListingError as e:
+                if verbose:
+                    print(f"{e}\nUsing the cached listing of {cache_name}")
+                fresh = True
+            else:
+                fresh = _total_items(first) == cached["total"]
+            if fresh:
+                try:
+                    os.utime(cache_file, None)
+                except OSError:
+                    pass
+        if fresh:
+            records = cached["records"]
+            is_sorted = cached.get("sorted", True)
+            if isinstance(info, list):
+                records = [tuple(r) for r in records]
+                if sort and not is_sorted:
+                    records.sort()
+                    is_sorted = True
+            _MEMO[key] = (time.time(), records, is_sorted)
+            return list(records), True
+
+    if first is None:
+        try:
+            first = _fetch_page(url)
+        except ListingError as e:
+            if verbose:
+                print(e)
+            return [], False
+    output, complete = _collect(url, info, sort=sort, first=first,
+                                verbose=verbose)
+    is_sorted = sort or not isinstance(info, list)  # "all" is never sorted
+
+    # Only a complete listing is cached; a partial one is returned as is
+    if output and complete:
+        try:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            tmp_file = f"{cache_file}.{os.getpid()}.tmp"
+            with open(tmp_file, "wb") as f:
+                f.write(gzip.compress(_dumps(
+                    {"url": url, "info": info, "total": _total_items(first),
+                     "sorted": is_sorted, "records": output})))
+            os.replace(tmp_file, cache_file)
+        except OSError as e:
+            print(f"Warning: Could not write listing cache {cache_file}: {e}")
+        _MEMO[key] = (time.time(), output, is_sorted)
+        output = list(output)
+
+    return output, complete
+
+
+def clear_cache():
+    """
+    Forget all cached listings, in memory and in CACHE_DIR.
+
+    The next call of get_mapsets, get_rasters or collect_responses_cached
+    queries the API again.
+    """
+    _MEMO.clear()
+    try:
+        names = os.listdir(CACHE_DIR)
+    except OSError:
+        return
+    for name in names:
+        if name.endswith(".json.gz"):
+            try:
+                os.remove(os.path.join(CACHE_DIR, name))
+            except OSError as e:
+                print(f"Warning: Could not remove listing cache {name}: {e}")
+
+
+def get_mapsets(include_caption=True, no_cache=False):
     """
     Get list of all available WaPOR v3 mapsets.
+    The listing is cached on disk for a day, see collect_responses_cached.
     
     Parameters
     ----------
     include_caption : bool
         If True, return (code, caption) tuples. If False, return only codes.
+    no_cache : bool
+        If True, query the API even if a cached listing exists.
         
     Returns
     -------
@@ -100,14 +519,24 @@ def get_mapsets(include_caption=True):
     >>> # [('L1-AETI-D', 'Actual Evapotranspiration...'), ...]
     """
     if include_caption:
-        return collect_responses(BASE_URL, info=["code", "caption"])
+        return collect_responses_cached(BASE_URL, "_mapsets_caption",
+                                        info=["code", "caption"],
+                                        no_cache=no_cache)
     else:
-        return collect_responses(BASE_URL, info=["code"])
+        return collect_responses_cached(BASE_URL, "_mapsets",
+                                        info=["code"], no_cache=no_cache)
 
 
-def get_rasters(mapset_code, include_url=True):
+def get_rasters(mapset_code, include_url=True, no_cache=False, sort=True,
+                date_prefix=None):
     """
     Get list of all rasters in a specific mapset.
+    The listing is cached on disk for a day, see collect_responses_cached.
+
+    With date_prefix the API is asked for the matching codes only, so fewer
+    pages are transferred. The result is checked against the prefix as well,
+    in case the server ignores the filter, and if the filtered request fails
+    or matches nothing the full listing is filtered instead.
     
     Parameters
     ----------
@@ -115,6 +544,14 @@ def get_rasters(mapset_code, include_url=True):
         Mapset code (e.g., 'L1-PCP-E', 'L2-AETI-M')
     include_url : bool
         If True, return (code, downloadUrl) tuples. If False, return only codes.
+    no_cache : bool
+        If True, query the API even if a cached listing exists.
+    sort : bool
+        If True (default), sort the listing by code. filter_rasters_by_date
+        does not need sorted input.
+    date_prefix : str, optional
+        Only list the rasters whose date part starts with this, e.g. '2020'
+        or '2020-05'. Default is None, all rasters.
         
     Returns
     -------
@@ -127,11 +564,74 @@ def get_rasters(mapset_code, include_url=True):
     >>> # [('L1-PCP-E.2020-01-01', 'https://...'), ...]
     """
     mapset_url = f"{BASE_URL}/{mapset_code}/rasters"
+    info = ["code", "downloadUrl"] if include_url else ["code"]
+
+    def matching(rasters):
+        return [r for r in rasters
+                if r[0].rpartition('.')[2].startswith(date_prefix)]
+
+    if date_prefix:
+        # Push the date predicate to the server. The filter syntax is not
+        # part of a documented API contract, so a failed or empty filtered
+        # listing falls back to the full listing, filtered here.
+        filtered_url = mapset_url + "?" + urlencode(
+            {"filter": f"code:like:'*.{date_prefix}*'"})
+        rasters, complete = _collect_cached(
+            filtered_url, f"{mapset_code}_{date_prefix}", info, no_cache,
+            sort, verbose=False)
+        rasters = matching(rasters)
+        if complete and rasters:
+            return rasters
     
-    if include_url:
-        return collect_responses(mapset_url, info=["code", "downloadUrl"])
-    else:
-        return collect_responses(mapset_url, info=["code"])
+    rasters = collect_responses_cached(mapset_url, mapset_code, info=info,
+                                       no_cache=no_cache, sort=sort)
+    if date_prefix:
+        rasters = matching(rasters)
+    return rasters
+
+
+def _date_prefix(start_date, end_date):
+    """
+    Year shared by start_date and end_date ('YYYY-MM-DD'), else None.
+
+    Every code dated within one year has a date part starting with that
+    year, whatever the temporal resolution. A month prefix would drop the
+    annual codes, so no narrower prefix is used.
+    """
+    if start_date[:4] == end_date[:4]:
+        return start_date[:4]
+    return None
+
+
+def get_rasters_by_date(mapset_code, start_date, end_date, no_cache=False):
+    """
+    get_rasters and filter_rasters_by_date in one call.
+
+    If the date range lies within one year, only that year is listed, see
+    get_rasters(date_prefix=...).
+
+    Parameters
+    ----------
+    mapset_code : str
+        Mapset code (e.g., 'L1-PCP-E', 'L2-AETI-M')
+    start_date, end_date : str
+        Date range (inclusive) in format 'YYYY-MM-DD'
+    no_cache : bool
+        If True, query the API even if a cached listing exists.
+
+    Returns
+    -------
+    list
+        (code, url) tuples within the date range, sorted by code
+
+    Example
+    -------
+    >>> rasters = get_rasters_by_date('L1-PCP-M', '2020-01-01', '2020-12-31')
+    """
+    rasters = get_rasters(mapset_code, include_url=True, no_cache=no_cache,
+                          date_prefix=_date_prefix(start_date, end_date))
+    return filter_rasters_by_date(rasters, start_date, end_date,
+                                  is_sorted=True)
 
 
 def get_raster_info(mapset_code):
@@ -153,18 +653,257 @@ def get_raster_info(mapset_code):
     return collect_responses(mapset_url, info="all")
 
 
-def filter_rasters_by_date(rasters, start_date, end_date):
+def get_raster_info_many(mapset_codes, max_workers=4):
+    """
+    get_raster_info for several mapsets, fetched concurrently.
+
+    Each mapset is listed in its own thread over the shared session, so the
+    round trips of different mapsets overlap.
+
+    Parameters
+    ----------
+    mapset_codes : list
+        Mapset codes (e.g., ['L1-PCP-M', 'L1-RET-M'])
+    max_workers : int
+        Number of mapsets listed at the same time, default is 4.
+
+    Returns
+    -------
+    dict
+        Mapset code -> list of dictionaries with complete raster information
+
+    Example
+    -------
+    >>> info = get_raster_info_many(['L1-PCP-M', 'L1-RET-M'])
+    >>> len(info['L1-PCP-M'])
+    """
+    mapset_codes = list(mapset_codes)
+    if not mapset_codes:
+        return {}
+    with ThreadPoolExecutor(
+            max_workers=min(max_workers, len(mapset_codes))) as executor:
+        return dict(zip(mapset_codes,
+                        executor.map(get_raster_info, mapset_codes)))
+
+
+def _download_raster(code, url, out_dir, chunk_size):
+    """Stream one raster to out_dir/<code>.tif, returns the path or None."""
+    out_path = os.path.join(out_dir, f"{code}.tif")
+    if os.path.exists(out_path):
+        return out_path
+    tmp_path = f"{out_path}.{os.getpid()}.part"
+    try:
+        with _SESSION.get(url, stream=True, timeout=60) as response:
+            response.raise_for_status()
+            with open(tmp_path, "wb") as f:
+                for chunk in response.iter_content(chunk_size=chunk_size):
+                    f.write(chunk)
+        os.replace(tmp_path, out_path)
+        return out_path
+    except (requests.exceptions.RequestException, OSError) as e:
+        print(f"Error downloading {code}: {e}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return None
+
+
+def download_rasters(rasters, out_dir, concurrency=8, chunk_size=1 << 20):
+    """
+    Download complete rasters, several at a time.
+
+    Each raster is streamed to out_dir/<code>.tif over the shared session;
+    rasters already in out_dir are skipped.
+
+    Parameters
+    ----------
+    rasters : list
+        (code, url) tuples, e.g. from filter_rasters_by_date()
+    out_dir : str
+        Output directory, created if needed
+    concurrency : int
+        Number of rasters downloaded at the same time, default is 8.
+    chunk_size : int
+        Download chunk size in bytes, default is 1 MB.
+
+    Returns
+    -------
+    list
+        Paths of the downloaded (or already present) rasters, in the order
+        of rasters. Failed downloads are left out.
+
+    Example
+    -------
+    >>> rasters = filter_rasters_by_date(get_rasters('L1-PCP-M'),
+    ...                                  '2020-01-01', '2020-12-31')
+    >>> paths = download_rasters(rasters, 'C:/Temp/L1-PCP-M')
+    """
+    rasters = list(rasters)
+    if not rasters:
+        return []
+    os.makedirs(out_dir, exist_ok=True)
+    with ThreadPoolExecutor(
+            max_workers=min(concurrency, len(rasters))) as executor:
+        paths = executor.map(
+            lambda r: _download_raster(r[0], r[1], out_dir, chunk_size),
+            rasters)
+        return [path for path in paths if path is not None]
+
+
+# Date part of a raster code: YYYY-MM-DD (daily), YYYY-MM-D1/D2/D3
+# (dekadal), YYYY-MM (monthly) or YYYY (annual)
+_DATE_RE = re.compile(r"^(\d{4})(?:-(\d{2})(?:-(?:D([123])|(\d{2})))?)?$")
+
+
+@lru_cache(maxsize=65536)
+def _parse_code_date(date_str):
+    """
+    Date of the date part of a raster code, e.g. '2020-01-D1' or '2020'.
+
+    Dekadal, monthly and annual codes map to the first day of their month
+    or year. Raises ValueError for anything else.
+    """
+    m = _DATE_RE.match(date_str)
+    if m is None:
+        raise ValueError(f"Unknown date format: {date_str}")
+    y, mo, _, d = m.groups()
+    return datetime(int(y), int(mo or 1), int(d or 1))
+
+
+def parse_date_from_code(code):
+    """
+    Date of a raster code, e.g. WAPOR-3.L1-AETI-D.2018-05-D2, as a
+    datetime.date (see _parse_code_date), or None if it has no date part.
+    """
+    _, dot, date_str = code.rpartition('.')
+    if not dot:
+        return None
+    try:
+        return _parse_code_date(date_str).date()
+    except ValueError:
+        return None
+
+
+def _as_datetime(d):
+    """A 'YYYY-MM-DD' string or a date as a datetime."""
+    if isinstance(d, str):
+        return datetime.strptime(d, '%Y-%m-%d')
+    return datetime(d.year, d.month, d.day)
+
+
+def _date_key(dt):
+    """Date as the integer YYYYMMDD, which orders like the date."""
+    return dt.year * 10000 + dt.month * 100 + dt.day
+
+
+@lru_cache(maxsize=65536)
+def _code_date_key(date_str):
+    """_parse_code_date as a YYYYMMDD integer, for cheap comparisons."""
+    return _date_key(_parse_code_date(date_str))
+
+
+class _CodeDates(object):
+    """YYYYMMDD keys of a (code, url) listing as a lazy sequence, for bisect."""
+
+    def __init__(self, rasters):
+        self.rasters = rasters
+
+    def __len__(self):
+        return len(self.rasters)
+
+    def __getitem__(self, i):
+        return _code_date_key(self.rasters[i][0].rpartition('.')[2])
+
+
+def _filter_rasters_sorted(rasters, start_key, end_key, keep_undated):
+    """
+    filter_rasters_by_date for a listing of one mapset sorted by code.
+
+    Within a mapset the codes only differ by their ISO date part, so code
+    order is date order and the window is found by bisection; only the
+    probed codes and the window are parsed. This assumes every code has a
+    date: an undated code is only noticed if it is probed, and then None is
+    returned, or if it lies in the window, and then it is kept (with a
+    warning) if keep_undated. Returns None as well if rasters is not a
+    listing of one mapset.
+    """
+    first = rasters[0][0].rpartition('.')
+    if not first[1] or first[0] != rasters[-1][0].rpartition('.')[0]:
+        return None
+
+    dates = _CodeDates(rasters)
+    try:
+        lo = bisect.bisect_left(dates, start_key)
+        hi = bisect.bisect_right(dates, end_key, lo)
+    except ValueError:
+        return None
+
+    filtered = []
+    for code, url in rasters[lo:hi]:
+        if parse_date_from_code(code) is None:
+            if not keep_undated:
+                continue
+            print(f"Warning: Could not parse date from code: {code}")
+        filtered.append((code, url))
+    return filtered
+
+
+def _filter_rasters_vectorized(rasters, start, end, keep_undated):
+    """
+    filter_rasters_by_date for long listings, with pandas string ops.
+
+    The date part of every code is padded to a full YYYY-MM-DD (dekadal
+    codes lose their -D1..-D3 suffix) and parsed in one to_datetime call.
+    Returns None if pandas is not installed.
+    """
+    # Imported here: pandas alone takes longer to import than this module
+    try:
+        import pandas as pd
+    except ImportError:
+        return None
+
+    codes = pd.Series([code for code, _ in rasters])
+    has_date = codes.str.contains('.', regex=False).to_numpy()
+    # Only -D1..-D3, as _DATE_RE: other suffixes leave an unparseable token
+    tokens = codes.str.rpartition('.')[2].str.replace(r'-D[123]$', '',
+                                                       regex=True)
+    dates = pd.to_datetime((tokens + '-01-01').str.slice(0, 10),
+                           format='%Y-%m-%d', errors='coerce', cache=True)
+
+    keep = has_date & dates.between(start, end).to_numpy()
+    if keep_undated:
+        unparsed = has_date & dates.isna().to_numpy()
+        for i in np.flatnonzero(unparsed):
+            # If date parsing fails, include it anyway
+            print(f"Warning: Could not parse date from code: {rasters[i][0]}")
+        keep |= unparsed
+    return [rasters[i] for i in np.flatnonzero(keep)]
+
+
+def filter_rasters_by_date(rasters, start_date, end_date, is_sorted=False,
+                           keep_undated=True):
     """
     Filter rasters by date range based on their code.
+
+    A listing of one mapset sorted by code, as returned by get_rasters(), is
+    filtered by bisection if is_sorted is set; other listings are checked
+    code by code.
     
     Parameters
     ----------
-    rasters : list
-        List of (code, url) tuples from get_rasters()
-    start_date : str
+    rasters : list or iterable
+        List of (code, url) tuples from get_rasters(), or an iterable of
+        them such as iter_responses(mapset_url, info=["code", "downloadUrl"])
+    start_date : str or date
         Start date in format 'YYYY-MM-DD'
-    end_date : str
+    end_date : str or date
         End date in format 'YYYY-MM-DD'
+    is_sorted : bool
+        True if rasters is one mapset's listing sorted by code, e.g. from
+        get_rasters(sort=True), in which every code has a date. This is not
+        checked, see _filter_rasters_sorted.
+    keep_undated : bool
+        If True (default), codes whose date cannot be parsed are kept with a
+        warning; otherwise they are left out.
         
     Returns
     -------
@@ -174,46 +913,152 @@ def filter_rasters_by_date(rasters, start_date, end_date):
     Example
     -------
     >>> rasters = get_rasters('L1-PCP-E')
-    >>> filtered = filter_rasters_by_date(rasters, '2020-01-01', '2020-12-31')
+    >>> filtered = filter_rasters_by_date(rasters, '2020-01-01', '2020-12-31',
+    ...                                   is_sorted=True)
     """
-    from datetime import datetime
-    
-    start = datetime.strptime(start_date, '%Y-%m-%d')
-    end = datetime.strptime(end_date, '%Y-%m-%d')
+    start = _as_datetime(start_date)
+    end = _as_datetime(end_date)
+    # Codes are compared as YYYYMMDD integers rather than datetimes
+    start_key = _date_key(start)
+    end_key = _date_key(end)
+
+    # An iterator, e.g. from iter_responses, is filtered as it is consumed
+    if hasattr(rasters, '__len__'):
+        if is_sorted and rasters:
+            filtered = _filter_rasters_sorted(rasters, start_key, end_key,
+                                              keep_undated)
+            if filtered is not None:
+                return filtered
+
+        if len(rasters) >= _VECTORIZE_MIN:
+            filtered = _filter_rasters_vectorized(rasters, start, end,
+                                                  keep_undated)
+            if filtered is not None:
+                return filtered
     
     filtered = []
     for code, url in rasters:
-        # Extract date from code
-        # Formats: YYYY-MM-DD (daily), YYYY-MM-D1/D2/D3 (dekadal), YYYY-MM (monthly), YYYY (annual)
+        # Extract date from code (e.g., L1-PCP-E.2020-01-01)
         try:
-            # Try daily format first (e.g., L1-PCP-E.2020-01-01)
             if '.' in code:
-                date_str = code.split('.')[-1]
-                
-                # Handle dekadal (YYYY-MM-D1)
-                if date_str.count('-') == 2 and date_str[-2:].startswith('D'):
-                    date_str = date_str[:-3]  # Remove -D1 part
-                    raster_date = datetime.strptime(date_str, '%Y-%m')
-                # Handle monthly (YYYY-MM)
-                elif date_str.count('-') == 1:
-                    raster_date = datetime.strptime(date_str, '%Y-%m')
-                # Handle annual (YYYY)
-                elif '-' not in date_str and len(date_str) == 4:
-                    raster_date = datetime.strptime(date_str, '%Y')
-                # Handle daily (YYYY-MM-DD)
-                else:
-                    raster_date = datetime.strptime(date_str, '%Y-%m-%d')
-                
-                if start <= raster_date <= end:
+                key = _code_date_key(code.split('.')[-1])
+                if start_key <= key <= end_key:
                     filtered.append((code, url))
         except (ValueError, IndexError):
-            # If date parsing fails, include it anyway
-            print(f"Warning: Could not parse date from code: {code}")
-            filtered.append((code, url))
+            if keep_undated:
+                # If date parsing fails, include it anyway
+                print(f"Warning: Could not parse date from code: {code}")
+                filtered.append((code, url))
     
     return filtered
 
 
+# Integer key of NaT in a datetime64 array viewed as int64
+_NAT_KEY = np.iinfo(np.int64).min
+
+# Catalogs of at least this many rasters are filtered with the numba kernel
+_NUMBA_MIN = 1000000
+
+
+def _date_mask_numpy(keys, lo, hi):
+    """Keys within [lo, hi], or NaT."""
+    return ((keys >= lo) & (keys <= hi)) | (keys == _NAT_KEY)
+
+
+@lru_cache(maxsize=None)
+def _date_mask_numba():
+    """
+    _date_mask_numpy in one parallel pass without temporaries, or None if
+    numba is not installed. numba is only imported, and the kernel only
+    compiled, once a catalog is large enough to need it.
+    """
+    try:
+        import numba
+    except ImportError:
+        return None
+
+    @numba.njit(parallel=True, cache=True)
+    def kernel(keys, lo, hi):
+        out = np.empty(keys.size, np.bool_)
+        for i in numba.prange(keys.size):
+            k = keys[i]
+            out[i] = (lo <= k and k <= hi) or k == _NAT_KEY
+        return out
+    return kernel
+
+
+@dataclass
+class RasterCatalog:
+    """
+    Raster listing of a mapset with the date of every code parsed once.
+
+    The listing is held as parallel arrays, so repeated date filters of the
+    same mapset are a vectorized comparison instead of a pass over the
+    codes. Codes whose date cannot be parsed get NaT and, as in
+    filter_rasters_by_date, are always kept.
+
+    Example
+    -------
+    >>> catalog = RasterCatalog.from_mapset('L1-PCP-M')
+    >>> rasters_2020 = catalog.filter('2020-01-01', '2020-12-31')
+    """
+    codes: np.ndarray
+    urls: np.ndarray
+    dates: np.ndarray  # datetime64[D]
+    keys: np.ndarray = field(init=False, repr=False)  # dates as int64 days
+
+    def __post_init__(self):
+        self.keys = self.dates.astype('datetime64[D]').view(np.int64)
+
+    @classmethod
+    def from_rasters(cls, rasters):
+        """Build a catalog from (code, url) tuples, e.g. from get_rasters()."""
+        # Codes without a date part are left out, as filter_rasters_by_date does
+        rasters = [(code, url) for code, url in rasters if '.' in code]
+        codes = [code for code, _ in rasters]
+        dates = []
+        for code in codes:
+            try:
+                dates.append(_parse_code_date(code.rpartition('.')[2]))
+            except ValueError:
+                dates.append(None)
+        return cls(codes=np.array(codes, dtype=object),
+                   urls=np.array([url for _, url in rasters], dtype=object),
+                   dates=np.array(dates, dtype='datetime64[D]'))
+
+    @classmethod
+    def from_mapset(cls, mapset_code, no_cache=False):
+        """Build the catalog of a mapset from its (cached) listing."""
+        return cls.from_rasters(get_rasters(mapset_code, include_url=True,
+                                            no_cache=no_cache))
+
+    def __len__(self):
+        return len(self.codes)
+
+    def filter(self, start_date, end_date):
+        """
+        Rasters dated within [start_date, end_date].
+
+        Parameters
+        ----------
+        start_date, end_date : str or date
+            Date range (inclusive), e.g. 'YYYY-MM-DD'
+
+        Returns
+        -------
+        list
+            (code, url) tuples, in catalog order
+        """
+        lo = np.datetime64(start_date, 'D').astype(np.int64)
+        hi = np.datetime64(end_date, 'D').astype(np.int64)
+        kernel = _date_mask_numba() if len(self.keys) >= _NUMBA_MIN else None
+        if kernel is not None:
+            mask = kernel(self.keys, lo, hi)
+        else:
+            mask = _date_mask_numpy(self.keys, lo, hi)
+        return list(zip(self.codes[mask].tolist(), self.urls[mask].tolist()))
+
+
 if __name__ == "__main__":
     # Test the functions
     print("Testing WaPOR v3 API...")
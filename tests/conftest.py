@@ -0,0 +1,6 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+
+# The WaPOR package lives in modules/
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, 'modules'))
@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the WaPOR v3 listing helpers against a fake API session.
+"""
+
+from datetime import date
+import json
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+import requests
+
+from WaPOR import waporv3_api
+
+
+class FakeResponse(object):
+
+    def __init__(self, url, status_code=200, body=None):
+        self.url = url
+        self.status_code = status_code
+        self.content = json.dumps(body or {}).encode('utf-8')
+        self.headers = {}
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(
+                f"{self.status_code} for url: {self.url}", response=self)
+
+
+class FakeSession(object):
+    """Serves a listing of n_items codes, page_size per numbered page."""
+
+    def __init__(self, n_items=95, page_size=10, fail_page=None,
+                 reject_filter=False, totals=False, trailing_next=False):
+        self.totals = totals
+        self.trailing_next = trailing_next
+        self.n_items = n_items
+        self.page_size = page_size
+        self.fail_page = fail_page
+        self.reject_filter = reject_filter
+        self.requests = []
+
+    def get(self, url, timeout=None, **kwargs):
+        self.requests.append(url)
+        query = parse_qs(urlsplit(url).query)
+        if 'filter' in query and self.reject_filter:
+            return FakeResponse(url, 400)
+        page = int(query.get('page', ['1'])[0])
+        if page == self.fail_page:
+            raise requests.exceptions.RetryError(
+                f"Max retries exceeded with url: {url}")
+        n_pages = -(-self.n_items // self.page_size)
+        if page > n_pages:
+            return FakeResponse(url, 404)
+        first = (page - 1) * self.page_size
+        items = [{'code': f'WAPOR-3.L1-PCP-M.{2018 + i // 12}-{i % 12 + 1:02d}',
+                  'downloadUrl': f'https://example.org/{i}.tif'}
+                 for i in range(first, min(first + self.page_size,
+                                           self.n_items))]
+        links = []
+        if page < n_pages or self.trailing_next:
+            base = url.split('?')[0]
+            links.append({'rel': 'next', 'href': f'{base}?page={page + 1}'})
+        body = {'items': items, 'links': links}
+        if self.totals:
+            body.update(totalItems=self.n_items, pageSize=self.page_size)
+        return FakeResponse(url, body={'response': body})
+
+
+@pytest.fixture
+def session(monkeypatch, tmp_path):
+    monkeypatch.setattr(waporv3_api, 'CACHE_DIR', str(tmp_path))
+    monkeypatch.setattr(waporv3_api, '_MEMO', {})
+
+    def install(**kwargs):
+        fake = FakeSession(**kwargs)
+        monkeypatch.setattr(waporv3_api, '_SESSION', fake)
+        return fake
+    return install
+
+
+def test_collect_responses_complete(session):
+    session()
+    rasters = waporv3_api.get_rasters('L1-PCP-M')
+    assert len(rasters) == 95
+    assert rasters == sorted(rasters)
+
+
+def test_partial_listing_is_not_cached(session, tmp_path):
+    session(fail_page=5)
+    rasters = waporv3_api.get_rasters('L1-PCP-M')
+    assert len(rasters) == 40
+    assert not list(tmp_path.iterdir())
+    assert waporv3_api._MEMO == {}
+
+    # Once the server recovers, the whole listing is returned
+    session()
+    assert len(waporv3_api.get_rasters('L1-PCP-M')) == 95
+
+
+def test_stale_cache_revalidated_by_total(session, monkeypatch):
+    session(totals=True)
+    assert len(waporv3_api.get_rasters('L1-PCP-M')) == 95
+
+    monkeypatch.setattr(waporv3_api, 'CACHE_TTL', -1)
+    fake = session(totals=True)
+    assert len(waporv3_api.get_rasters('L1-PCP-M')) == 95
+    assert len(fake.requests) == 1  # Only the first page
+
+    fake = session(n_items=97, totals=True)
+    assert len(waporv3_api.get_rasters('L1-PCP-M')) == 97
+    assert fake.requests.count(fake.requests[0]) == 1  # First page reused
+
+
+def test_rejected_date_filter_falls_back_to_full_listing(session):
+    fake = session(reject_filter=True)
+    rasters = waporv3_api.get_rasters_by_date('L1-PCP-M', '2019-01-01',
+                                              '2019-12-31')
+    assert [code for code, _ in rasters] == [
+        f'WAPOR-3.L1-PCP-M.2019-{m:02d}' for m in range(1, 13)]
+    assert 'filter' in fake.requests[0]
+    assert 'filter' not in fake.requests[1]
+
+
+def test_accepted_date_filter_is_used(session):
+    fake = session()  # Ignores the filter, but answers
+    rasters = waporv3_api.get_rasters('L1-PCP-M', date_prefix='2019')
+    assert len(rasters) == 12
+    assert 'filter' in fake.requests[0]
+    assert not any(url.endswith('/rasters') for url in fake.requests)
+
+
+def test_lookahead_past_the_end_is_quiet(session, capsys):
+    # The last page still links to a next page, which is a 404
+    fake = session(trailing_next=True)
+    rasters = waporv3_api.collect_responses(
+        waporv3_api.BASE_URL + '/L1-PCP-M/rasters')
+    assert len(rasters) == 95
+    assert any(url.endswith('page=11') for url in fake.requests)
+    assert capsys.readouterr().out == ''
+
+
+def test_http_error_does_not_claim_retries(session, capsys):
+    session(reject_filter=True)
+    waporv3_api.collect_responses(
+        waporv3_api.BASE_URL + "/L1-PCP-M/rasters?filter=code:like:'*'")
+    out = capsys.readouterr().out
+    assert '400' in out
+    assert 'retries' not in out
+
+
+def test_sorted_filter_matches_code_by_code(capsys):
+    rasters = [(f'WAPOR-3.L1-PCP-M.{y}-{m:02d}', 'u')
+               for y in (2019, 2020) for m in range(1, 13)]
+    windows = [('2020-03-01', '2020-04-30'), ('2018-01-01', '2019-01-31'),
+               ('2020-12-01', '2021-06-30'), ('2021-01-01', '2021-12-31')]
+    for start, end in windows:
+        assert (waporv3_api.filter_rasters_by_date(rasters, start, end,
+                                                   is_sorted=True)
+                == waporv3_api.filter_rasters_by_date(iter(rasters), start, end))
+    # An undated code the bisection probes sends it to the code-by-code path
+    rasters[12] = ('WAPOR-3.L1-PCP-M.latest', 'u')
+    filtered = waporv3_api.filter_rasters_by_date(
+        rasters, '2020-03-01', '2020-04-30', is_sorted=True)
+    assert [code for code, _ in filtered] == [
+        'WAPOR-3.L1-PCP-M.latest', 'WAPOR-3.L1-PCP-M.2020-03',
+        'WAPOR-3.L1-PCP-M.2020-04']
+    assert capsys.readouterr().out.count('Could not parse') == 1
+
+
+def test_date_filter_paths_agree_on_dekads():
+    rasters = [(f'WAPOR-3.L1-AETI-D.2020-{m:02d}-D{d}', 'u')
+               for m in range(1, 13) for d in (1, 2, 3, 4)]
+    assert waporv3_api.parse_date_from_code(rasters[0][0]) == date(2020, 1, 1)
+    assert waporv3_api.parse_date_from_code(rasters[3][0]) is None
+    start, end = date(2020, 3, 1), date(2020, 4, 30)
+    expected = [r for r in rasters if r[0][-2:] != 'D4'
+                and r[0].split('.')[-1][:7] in ('2020-03', '2020-04')]
+    loop = waporv3_api.filter_rasters_by_date(iter(rasters), start, end,
+                                              keep_undated=False)
+    assert loop == expected
+    long = rasters * 5  # Long enough for the vectorized path
+    assert (waporv3_api.filter_rasters_by_date(long, start, end,
+                                               keep_undated=False)
+            == [r for r in long if r in expected])